@@ -0,0 +1,97 @@
+"""
+Correcao da atitude da camera a partir de ROIs com posicao conhecida (problema de Wahba).
+
+Todas as funcoes aceitam lotes: F frames com ate N ROIs cada, em arrays (F,N,3). ROIs ausentes
+em um frame sao marcados com valid = False.
+"""
+import itertools
+import numpy as np
+
+def roi_bearings(K_inv, roi_enus, roi_pixels, t_drone):
+    """
+    Direcoes unitarias de cada ROI no mundo (a partir do drone) e na camera (a partir do pixel).
+
+    :param roi_enus: (...,N,3) posicoes ENU dos ROIs
+    :param roi_pixels: (...,N,2) pixels dos ROIs
+    :param t_drone: (...,3) posicao do drone em ENU
+    :return: (a, b) com R a = b para a rotacao mundo -> camera correta
+    """
+    roi_enus = np.asarray(roi_enus, dtype=np.float64)
+    roi_pixels = np.asarray(roi_pixels, dtype=np.float64)
+    a = roi_enus - np.asarray(t_drone, dtype=np.float64)[..., None, :]
+    b = np.concatenate((roi_pixels, np.ones(roi_pixels.shape[:-1] + (1,))), axis=-1) @ np.asarray(K_inv).T
+    return (a / np.linalg.norm(a, axis=-1, keepdims=True),
+            b / np.linalg.norm(b, axis=-1, keepdims=True))
+
+def wahba_rotation(a, b, weights=None):
+    """
+    Rotacao R que minimiza sum w |b - R a|^2 (SVD/Kabsch), para cada frame do lote.
+
+    :param a: (...,N,3) direcoes no mundo
+    :param b: (...,N,3) direcoes na camera
+    :param weights: (...,N) pesos (0 para ROIs ausentes); padrao 1
+    :return: R (...,3,3)
+    """
+    if weights is None:
+        weights = np.ones(a.shape[:-1])
+    B = np.einsum('...n,...ni,...nj->...ij', weights, b, a)
+    U, _, Vt = np.linalg.svd(B)
+    d = np.sign(np.linalg.det(U @ Vt))
+    d[d == 0] = 1
+    D = np.zeros(B.shape)
+    D[..., 0, 0] = 1
+    D[..., 1, 1] = 1
+    D[..., 2, 2] = d
+    return U @ D @ Vt
+
+def angular_residuals(R, a, b):
+    """ Angulo (rad) entre R a e b para cada ROI: R (...,3,3), a e b (...,N,3) -> (...,N). """
+    cosines = np.einsum('...ij,...nj,...ni->...n', R, a, b)
+    return np.arccos(np.clip(cosines, -1.0, 1.0))
+
+def ransac_rotation(a, b, valid=None, threshold_deg=1.0, max_hypotheses=64, rng=None):
+    """
+    Rotacao robusta para F frames de uma vez: hipoteses a partir de pares de ROIs (todos os pares,
+    ou max_hypotheses sorteados), escolha da hipotese com mais inliers em cada frame e reajuste
+    com todos os inliers.
+
+    :param a: (F,N,3) direcoes no mundo
+    :param b: (F,N,3) direcoes na camera
+    :param valid: (F,N) ROIs presentes em cada frame; padrao todos
+    :return: (R (F,3,3), inliers (F,N)); frames com menos de dois ROIs validos recebem NaN
+    """
+    a = np.asarray(a, dtype=np.float64)
+    b = np.asarray(b, dtype=np.float64)
+    F, N = a.shape[:2]
+    valid = np.ones((F, N), dtype=bool) if valid is None else np.asarray(valid, dtype=bool)
+    threshold = np.radians(threshold_deg)
+
+    pairs = np.array(list(itertools.combinations(range(N), 2)), dtype=int).reshape(-1, 2)
+    if len(pairs) > max_hypotheses:
+        rng = np.random.default_rng() if rng is None else rng
+        pairs = pairs[rng.choice(len(pairs), max_hypotheses, replace=False)]
+    if len(pairs) == 0:
+        return np.full((F, 3, 3), np.nan), np.zeros((F, N), dtype=bool)
+
+    # Hipoteses (F,P,3,3) a partir de cada par
+    weights = np.zeros((F, len(pairs), N))
+    P = np.arange(len(pairs))
+    weights[:, P, pairs[:, 0]] = 1
+    weights[:, P, pairs[:, 1]] = 1
+    weights *= valid[:, None, :]
+    pair_valid = valid[:, pairs[:, 0]] & valid[:, pairs[:, 1]]
+    hypotheses = wahba_rotation(a[:, None], b[:, None], weights)
+
+    # Inliers de cada hipotese; a melhor tem mais inliers e, no empate, menor erro
+    residuals = angular_residuals(hypotheses, a[:, None], b[:, None])
+    hypothesis_inliers = (residuals < threshold) & valid[:, None, :] & pair_valid[:, :, None]
+    cost = np.where(hypothesis_inliers, residuals, threshold).sum(axis=-1) - hypothesis_inliers.sum(axis=-1) * N * threshold
+    cost[~pair_valid] = np.inf
+    best = np.argmin(cost, axis=1)
+    inliers = hypothesis_inliers[np.arange(F), best]
+    # Sem consenso (menos de dois inliers): usar todos os ROIs validos
+    inliers = np.where((inliers.sum(axis=1) < 2)[:, None], valid, inliers)
+
+    R = wahba_rotation(a, b, inliers.astype(np.float64))
+    R[~pair_valid.any(axis=1)] = np.nan
+    return R, inliers
@@ -0,0 +1,54 @@
+import json
+import cv2
+import numpy as np
+
+def load_camera(file_path):
+    """
+    Le o arquivo JSON da camera: a matriz K pura (como K-mavic-HD.json) ou um objeto
+    {"K": [[...]], "dist": [k1, k2, p1, p2, k3]} com os coeficientes de distorcao do OpenCV
+    (e, opcionalmente, "width" e "height" da imagem, lidos por load_image_size).
+
+    :return: (K (3,3), coeficientes de distorcao ou None)
+    """
+    with open(file_path, "r") as json_file:
+        data = json.load(json_file)
+    if isinstance(data, dict):
+        K = np.array(data["K"], dtype=np.float64)
+        dist = data.get("dist")
+        dist = np.array(dist, dtype=np.float64).reshape(-1) if dist is not None else None
+        if dist is not None and not np.any(dist):
+            dist = None
+        return K, dist
+    return np.array(data, dtype=np.float64), None
+
+def load_image_size(file_path):
+    """ Tamanho (largura, altura) da imagem no arquivo JSON da camera ("width" e "height" no objeto), ou None. """
+    with open(file_path, "r") as json_file:
+        data = json.load(json_file)
+    if isinstance(data, dict) and "width" in data and "height" in data:
+        return int(data["width"]), int(data["height"])
+    return None
+
+class Undistorter:
+    """
+    Remocao da distorcao da lente para a camera pinhole de mesma K. Os mapas do remap sao
+    calculados uma unica vez; por frame so ha o remap da imagem e a conversao dos pontos em lote.
+    """
+    def __init__(self, K, dist, width=None, height=None):
+        self.K = np.asarray(K, dtype=np.float64)
+        self.dist = np.asarray(dist, dtype=np.float64)
+        # Sem tamanho de imagem (ex.: geolocalizacao em lote) so os pontos sao corrigidos
+        self.map1, self.map2 = None, None
+        if width is not None:
+            self.map1, self.map2 = cv2.initUndistortRectifyMap(self.K, self.dist, None, self.K, (width, height), cv2.CV_16SC2)
+
+    def image(self, image):
+        """ Imagem sem distorcao (nova imagem; a original nao e alterada). """
+        return cv2.remap(image, self.map1, self.map2, cv2.INTER_LINEAR)
+
+    def points(self, pixels):
+        """ Pixels (N,2) da imagem original -> pixels (N,2) da imagem sem distorcao. """
+        pixels = np.asarray(pixels, dtype=np.float64).reshape(-1, 1, 2)
+        if len(pixels) == 0:
+            return pixels.reshape(-1, 2)
+        return cv2.undistortPoints(pixels, self.K, self.dist, P=self.K).reshape(-1, 2)
@@ -0,0 +1,360 @@
+import os
+import numpy as np
+from collections import OrderedDict
+import rasterio
+from rasterio.windows import Window
+
+# Estados retornados pela intersecao em lote
+DEM_HIT = 0
+DEM_OUTSIDE = 1
+DEM_DIVERGED = 2
+
+# Versao do formato do cache dos maximos por bloco; incrementar ao mudar o conteudo
+TILE_MAX_CACHE_VERSION = 1
+
+def get_DEM_alt_batch(dem_elevation_data, dem_transform, east_utm, north_utm):
+    """
+    Consulta o vizinho mais proximo do DEM para varios pontos de uma vez.
+
+    :param east_utm: Array de coordenadas east (UTM)
+    :param north_utm: Array de coordenadas north (UTM), mesmo formato de east_utm
+    :return: (alt, inside) - altitudes (NaN fora do raster) e mascara dos pontos dentro do raster
+    """
+    east_utm = np.asarray(east_utm, dtype=np.float64)
+    north_utm = np.asarray(north_utm, dtype=np.float64)
+
+    # ~transform leva (east, north) para (coluna, linha)
+    inv = ~dem_transform
+    col = np.rint(inv.a * east_utm + inv.b * north_utm + inv.c)
+    row = np.rint(inv.d * east_utm + inv.e * north_utm + inv.f)
+
+    inside = (row >= 0) & (row < dem_elevation_data.shape[0]) & (col >= 0) & (col < dem_elevation_data.shape[1])
+    alt = np.full(east_utm.shape, np.nan)
+    alt[inside] = dem_elevation_data[row[inside].astype(np.intp), col[inside].astype(np.intp)]
+    return alt, inside
+
+def max_pool(level):
+    """ Maximo de cada bloco 2x2 (bordas impares completadas com o menor valor do tipo). """
+    rows, cols = level.shape
+    lowest = -np.inf if np.issubdtype(level.dtype, np.floating) else np.iinfo(level.dtype).min
+    padded = np.full((rows + rows % 2, cols + cols % 2), lowest, dtype=level.dtype)
+    padded[:rows, :cols] = level
+    return padded.reshape(padded.shape[0] // 2, 2, padded.shape[1] // 2, 2).max(axis=(1, 3))
+
+def max_pyramid_levels(level):
+    """ Niveis da piramide de maximos 2x2, do raster original ate uma unica celula. """
+    levels = [level]
+    while level.shape[0] > 1 or level.shape[1] > 1:
+        level = max_pool(level)
+        levels.append(level)
+    return levels
+
+def pyramid_shapes(shape):
+    shapes = [tuple(shape)]
+    while shapes[-1] != (1, 1):
+        shapes.append((-(-shapes[-1][0] // 2), -(-shapes[-1][1] // 2)))
+    return shapes
+
+def write_pyramid_arrays(tif_path, directory, name="dem", strip_rows=1024):
+    """
+    Grava a piramide de maximos do GeoTIFF em arquivos .npy (heights, offsets, widths), no tipo do
+    raster, sem carregar o raster inteiro: cada nivel e calculado por faixas de linhas a partir do
+    nivel anterior ja gravado (mapeado em memoria).
+
+    :return: (caminhos por nome do array, shape do raster, transform)
+    """
+    with rasterio.open(tif_path) as dataset:
+        shapes = pyramid_shapes((dataset.height, dataset.width))
+        sizes = [rows * cols for rows, cols in shapes]
+        offsets = np.cumsum([0] + sizes[:-1])
+        widths = np.array([cols for _, cols in shapes])
+        paths = {key: os.path.join(directory, f"{name}_{key}.npy") for key in ('heights', 'offsets', 'widths')}
+        heights = np.lib.format.open_memmap(paths['heights'], mode='w+', dtype=dataset.dtypes[0], shape=(sum(sizes),))
+
+        rows, cols = shapes[0]
+        for row in range(0, rows, strip_rows):
+            count = min(strip_rows, rows - row)
+            strip = dataset.read(1, window=Window(0, row, cols, count))
+            heights[row * cols:(row + count) * cols] = strip.ravel()
+        transform = dataset.transform
+
+    strip_rows += strip_rows % 2
+    for level in range(1, len(shapes)):
+        (previous_rows, previous_cols), (rows, cols) = shapes[level - 1], shapes[level]
+        previous = heights[offsets[level - 1]:offsets[level - 1] + sizes[level - 1]].reshape(previous_rows, previous_cols)
+        current = heights[offsets[level]:offsets[level] + sizes[level]].reshape(rows, cols)
+        for row in range(0, rows, strip_rows // 2):
+            current[row:row + strip_rows // 2] = max_pool(previous[2 * row:2 * row + strip_rows])
+    heights.flush()
+    del heights
+
+    np.save(paths['offsets'], offsets)
+    np.save(paths['widths'], widths)
+    return paths, shapes[0], transform
+
+def flatten_levels(levels):
+    heights = np.concatenate([l.ravel() for l in levels])
+    offsets = np.cumsum([0] + [l.size for l in levels[:-1]])
+    widths = np.array([l.shape[1] for l in levels])
+    return heights, offsets, widths
+
+class DEMPyramid:
+    """
+    Piramide de altitudes maximas (quadtree) do DEM.
+
+    Cada nivel guarda o maximo de blocos 2x2 do nivel anterior, o que permite pular
+    regioes onde o raio passa acima de todo o terreno e encontrar a primeira
+    intersecao real com a superficie de vizinho mais proximo usada por get_DEM_alt_batch.
+    """
+    def __init__(self, dem_elevation_data, dem_transform):
+        self.transform = dem_transform
+        self.inv_transform = ~dem_transform
+        self.shape = dem_elevation_data.shape
+
+        # Todos os niveis em um unico vetor para consultar niveis diferentes de uma vez
+        levels = max_pyramid_levels(np.asarray(dem_elevation_data, dtype=np.float64))
+        self.top = len(levels) - 1
+        self.heights, self.offsets, self.widths = flatten_levels(levels)
+
+    @classmethod
+    def from_arrays(cls, heights, offsets, widths, shape, dem_transform):
+        """ Piramide a partir de niveis ja calculados (ex.: arrays mapeados em memoria compartilhada). """
+        pyramid = cls.__new__(cls)
+        pyramid.transform = dem_transform
+        pyramid.inv_transform = ~dem_transform
+        pyramid.shape = tuple(shape)
+        pyramid.top = len(offsets) - 1
+        pyramid.heights, pyramid.offsets, pyramid.widths = heights, offsets, widths
+        return pyramid
+
+    def max_heights(self, level, rows, cols):
+        """ Altitude maxima das celulas (rows, cols) em cada nivel da piramide. """
+        return self.heights[self.offsets[level] + rows * self.widths[level] + cols]
+
+    def __getitem__(self, index):
+        # O nivel 0 e o proprio DEM: permite usar a piramide no lugar de dem_elevation_data
+        rows, cols = index
+        return self.max_heights(0, np.asarray(rows, dtype=np.intp), np.asarray(cols, dtype=np.intp))
+
+    def prefetch(self, east_utm, north_utm):
+        # Tudo ja esta em memoria
+        pass
+
+    def intersect(self, origins, directions, max_steps=None):
+        """
+        Primeira intersecao de varios raios com o DEM.
+
+        :param origins: Array (N,3) com as origens dos raios (east, north, up) em UTM
+        :param directions: Array (N,3) com as direcoes apontando para cima; o raio percorre origem - s * direcao
+        :param max_steps: Limite de passos da travessia (padrao proporcional ao tamanho do raster)
+        :return: (points, status) - points (N,3) com NaN onde nao houve intersecao
+                 e status (N,) com DEM_HIT, DEM_OUTSIDE ou DEM_DIVERGED
+        """
+        origins = np.asarray(origins, dtype=np.float64).reshape(-1, 3)
+        down = -np.asarray(directions, dtype=np.float64).reshape(-1, 3)
+        rows, cols = self.shape
+        inv = self.inv_transform
+        if max_steps is None:
+            max_steps = 2 * (self.top + 1) * (rows + cols)
+
+        # Raio no espaco do raster; a celula c de vizinho mais proximo ocupa [c, c + 1)
+        u0 = inv.a * origins[:, 0] + inv.b * origins[:, 1] + inv.c + 0.5
+        v0 = inv.d * origins[:, 0] + inv.e * origins[:, 1] + inv.f + 0.5
+        du = inv.a * down[:, 0] + inv.b * down[:, 1]
+        dv = inv.d * down[:, 0] + inv.e * down[:, 1]
+        z0 = origins[:, 2]
+        dz = down[:, 2]
+        nudge = 1e-6 / np.maximum(np.maximum(np.abs(du), np.abs(dv)), 1e-12)
+
+        n = origins.shape[0]
+        s = np.zeros(n)
+        level = np.full(n, self.top)
+        status = np.full(n, DEM_DIVERGED, dtype=np.int8)
+        active = np.arange(n)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            for _ in range(max_steps):
+                if active.size == 0:
+                    break
+
+                u = u0[active] + s[active] * du[active]
+                v = v0[active] + s[active] * dv[active]
+                inside = (u >= 0) & (u < cols) & (v >= 0) & (v < rows)
+                status[active[~inside]] = DEM_OUTSIDE
+                active, u, v = active[inside], u[inside], v[inside]
+
+                sa = s[active]
+                la = level[active]
+                size = np.ldexp(1.0, la)
+                cu = np.floor(u / size)
+                cv = np.floor(v / size)
+                H = self.max_heights(la, cv.astype(np.intp), cu.astype(np.intp))
+
+                # Ponto em que o raio sai da celula atual
+                du_a = du[active]
+                dv_a = dv[active]
+                tu = np.where(du_a > 0, ((cu + 1) * size - u) / du_a, np.where(du_a < 0, (cu * size - u) / du_a, np.inf))
+                tv = np.where(dv_a > 0, ((cv + 1) * size - v) / dv_a, np.where(dv_a < 0, (cv * size - v) / dv_a, np.inf))
+                s_exit = sa + np.minimum(tu, tv)
+
+                z = z0[active] + sa * dz[active]
+                z_exit = np.where(dz[active] == 0, z, z0[active] + s_exit * dz[active])
+                below = np.minimum(z, z_exit) <= H
+                # Avancar ate a altura maxima da celula (ou ficar parado se ja estiver abaixo dela)
+                s_top = np.where(z <= H, sa, sa + (z - H) / -dz[active])
+
+                # Raio acima de todo o bloco: pular para o proximo e subir um nivel
+                miss = ~below
+                s[active[miss]] = s_exit[miss] + nudge[active[miss]]
+                level[active[miss]] = np.minimum(la[miss] + 1, self.top)
+
+                # Celula do DEM atingida
+                found = below & (la == 0)
+                s[active[found]] = s_top[found]
+                status[active[found]] = DEM_HIT
+
+                # Bloco possivelmente atingido: descer um nivel
+                refine = below & (la > 0)
+                s[active[refine]] = s_top[refine]
+                level[active[refine]] -= 1
+
+                active = active[~found]
+
+        points = origins + s[:, None] * down
+        points[status != DEM_HIT] = np.nan
+        return points, status
+
+class TiledDEM(DEMPyramid):
+    """
+    DEM lido sob demanda em blocos de tile_size x tile_size, com cache LRU limitado a cache_mb.
+
+    O dataset do rasterio fica aberto; cada bloco lido guarda tambem sua piramide de maximos local.
+    Os niveis acima do tamanho do bloco (um valor por bloco) vem do maximo de cada bloco, lido em uma
+    unica passada na primeira abertura e guardado em um cache (.npz) ao lado do GeoTIFF, valido
+    enquanto mtime e tamanho do arquivo nao mudarem.
+    Pode ser usado no lugar de dem_elevation_data: suporta .shape e indexacao dem[rows, cols].
+    """
+    def __init__(self, tif_path, tile_size=256, cache_mb=256, cache=True):
+        self.tile_level = int(np.log2(tile_size))
+        if 2 ** self.tile_level != tile_size:
+            raise ValueError("O tamanho do bloco deve ser uma potencia de 2.")
+
+        self.dataset = rasterio.open(tif_path)
+        self.transform = self.dataset.transform
+        self.inv_transform = ~self.transform
+        self.crs = self.dataset.crs
+        self.shape = (self.dataset.height, self.dataset.width)
+        self.tile_size = tile_size
+        self.tiles_shape = (-(-self.shape[0] // tile_size), -(-self.shape[1] // tile_size))
+
+        self.cache_bytes = cache_mb * 2**20
+        self.tiles = OrderedDict()
+        self.tiles_bytes = 0
+
+        # Piramide local de um bloco: mesmos deslocamentos para todos os blocos
+        local_levels = max_pyramid_levels(np.zeros((tile_size, tile_size), dtype=np.float32))
+        _, self.local_offsets, self.local_widths = flatten_levels(local_levels)
+        self.tile_bytes = (self.local_offsets[-1].item() + 1) * np.dtype(np.float32).itemsize
+
+        # Niveis grossos a partir do maximo de cada bloco
+        coarse_levels = max_pyramid_levels(self._tile_max(tif_path, cache))
+        self.top = self.tile_level + len(coarse_levels) - 1
+        self.heights, self.offsets, self.widths = flatten_levels(coarse_levels)
+
+    def _tile_max(self, tif_path, cache):
+        """ Maximo de cada bloco, do cache ao lado do GeoTIFF ou lendo todos os blocos (e gravando o cache). """
+        stat = os.stat(tif_path)
+        cache_path = f"{tif_path}.tiles{self.tile_size}.npz"
+        if cache and os.path.exists(cache_path):
+            try:
+                with np.load(cache_path) as cached:
+                    if (int(cached['version']) == TILE_MAX_CACHE_VERSION and int(cached['mtime_ns']) == stat.st_mtime_ns
+                            and int(cached['size']) == stat.st_size and cached['tile_max'].shape == self.tiles_shape):
+                        return cached['tile_max']
+            except (OSError, KeyError, ValueError) as e:
+                print(f"Cache do DEM invalido ({e}), relendo {tif_path}")
+
+        tile_max = np.empty(self.tiles_shape, dtype=np.float32)
+        for tile_row in range(self.tiles_shape[0]):
+            for tile_col in range(self.tiles_shape[1]):
+                tile_max[tile_row, tile_col] = self._read_tile(tile_row, tile_col).max()
+
+        if cache:
+            try:
+                with open(cache_path, 'wb') as cache_file:
+                    np.savez(cache_file, version=TILE_MAX_CACHE_VERSION, mtime_ns=stat.st_mtime_ns, size=stat.st_size,
+                             tile_max=tile_max)
+            except OSError as e:
+                print(f"Nao foi possivel gravar o cache do DEM: {e}")
+        return tile_max
+
+    def _read_tile(self, tile_row, tile_col):
+        window = Window(tile_col * self.tile_size, tile_row * self.tile_size, self.tile_size, self.tile_size)
+        return self.dataset.read(1, window=window, boundless=False).astype(np.float32)
+
+    def tile(self, tile_row, tile_col):
+        """ Piramide local (vetor unico) do bloco, lendo do disco se nao estiver no cache. """
+        key = (tile_row, tile_col)
+        if key in self.tiles:
+            self.tiles.move_to_end(key)
+            return self.tiles[key]
+
+        data = self._read_tile(tile_row, tile_col)
+        padded = np.full((self.tile_size, self.tile_size), -np.inf, dtype=np.float32)
+        padded[:data.shape[0], :data.shape[1]] = data
+        local, _, _ = flatten_levels(max_pyramid_levels(padded))
+
+        self.tiles[key] = local
+        self.tiles_bytes += local.nbytes
+        while self.tiles_bytes > self.cache_bytes and len(self.tiles) > 1:
+            _, evicted = self.tiles.popitem(last=False)
+            self.tiles_bytes -= evicted.nbytes
+        return local
+
+    def max_heights(self, level, rows, cols):
+        level = np.broadcast_to(level, np.shape(rows))
+        result = np.empty(np.shape(rows), dtype=np.float32)
+
+        coarse = level >= self.tile_level
+        if coarse.any():
+            coarse_level = level[coarse] - self.tile_level
+            result[coarse] = self.heights[self.offsets[coarse_level] + rows[coarse] * self.widths[coarse_level] + cols[coarse]]
+
+        fine = ~coarse
+        if fine.any():
+            fine_level = level[fine]
+            shift = self.tile_level - fine_level
+            tile_rows = rows[fine] >> shift
+            tile_cols = cols[fine] >> shift
+            local_index = (self.local_offsets[fine_level]
+                           + (rows[fine] - (tile_rows << shift)) * self.local_widths[fine_level]
+                           + (cols[fine] - (tile_cols << shift)))
+            tile_keys = tile_rows * self.tiles_shape[1] + tile_cols
+            fine_result = np.empty(tile_keys.shape, dtype=np.float32)
+            for key in np.unique(tile_keys):
+                in_tile = tile_keys == key
+                fine_result[in_tile] = self.tile(*divmod(int(key), self.tiles_shape[1]))[local_index[in_tile]]
+            result[fine] = fine_result
+        return result
+
+    def prefetch(self, east_utm, north_utm):
+        """ Carrega os blocos que cobrem o retangulo envolvente dos pontos (ex.: a pegada da camera no solo). """
+        east_utm = np.asarray(east_utm, dtype=np.float64)
+        north_utm = np.asarray(north_utm, dtype=np.float64)
+        inv = self.inv_transform
+        cols = inv.a * east_utm + inv.b * north_utm + inv.c
+        rows = inv.d * east_utm + inv.e * north_utm + inv.f
+        row_range = np.clip([np.floor(rows.min()), np.floor(rows.max())], 0, self.shape[0] - 1).astype(int) // self.tile_size
+        col_range = np.clip([np.floor(cols.min()), np.floor(cols.max())], 0, self.shape[1] - 1).astype(int) // self.tile_size
+
+        # Usar no maximo metade do cache com blocos antecipados
+        budget = max(1, self.cache_bytes // self.tile_bytes // 2)
+        for tile_row in range(row_range[0], row_range[1] + 1):
+            for tile_col in range(col_range[0], col_range[1] + 1):
+                if budget == 0:
+                    return
+                self.tile(tile_row, tile_col)
+                budget -= 1
+
+    def close(self):
+        self.dataset.close()
@@ -0,0 +1,281 @@
+"""
+Detectores de objetos com a mesma interface: detect(image, frame_index=None) -> lista de predicoes.
+
+Cada predicao e um dicionario no formato do inference_sdk (x, y = centro; width, height;
+confidence; class_id; class), ja em pixels da imagem original.
+"""
+import hashlib
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+import numpy as np
+
+class HTTPDetector:
+    """ Inferencia remota pelo InferenceHTTPClient, com a imagem reduzida por scale antes do envio. """
+    def __init__(self, api_url, api_key, model_id, scale=6):
+        from inference_sdk import InferenceHTTPClient
+        self.client = InferenceHTTPClient(api_url=api_url, api_key=api_key)
+        self.api_model_id = model_id
+        self.scale = scale
+        # Identifica o modelo e a reducao da imagem, que muda o resultado (para o cache de deteccoes)
+        self.model_id = f"http:{model_id}:{scale}"
+
+    def detect(self, image, frame_index=None):
+        height, width = image.shape[:2]
+        short_image = cv2.resize(image, (int(width / self.scale), int(height / self.scale)))
+        results = self.client.infer(short_image, model_id=self.api_model_id)
+        predictions = []
+        for prediction in results['predictions']:
+            prediction = dict(prediction)
+            for key in ('x', 'y', 'width', 'height'):
+                prediction[key] = prediction[key] * self.scale
+            predictions.append(prediction)
+        return predictions
+
+class ONNXDetector:
+    """
+    Inferencia local na CPU com cv2.dnn a partir de um modelo exportado em ONNX (saida no formato
+    YOLOv8: (1, 4 + classes, N) com cx, cy, w, h e a pontuacao de cada classe).
+    """
+    def __init__(self, model_path, input_size=640, confidence=0.4, nms_threshold=0.45, class_names=None):
+        self.net = cv2.dnn.readNetFromONNX(model_path)
+        self.net.setPreferableBackend(cv2.dnn.DNN_BACKEND_OPENCV)
+        self.net.setPreferableTarget(cv2.dnn.DNN_TARGET_CPU)
+        self.input_size = input_size
+        self.confidence = confidence
+        self.nms_threshold = nms_threshold
+        self.class_names = class_names
+        # Identifica o modelo e as opcoes que mudam o resultado (para o cache de deteccoes)
+        self.model_id = f"onnx:{model_identity(model_path)}:{input_size}:{confidence}:{nms_threshold}"
+        # A rede nao pode ser usada por duas threads ao mesmo tempo
+        self.lock = threading.Lock()
+
+    def detect(self, image, frame_index=None):
+        height, width = image.shape[:2]
+        blob = cv2.dnn.blobFromImage(image, 1 / 255.0, (self.input_size, self.input_size), swapRB=True, crop=False)
+        with self.lock:
+            self.net.setInput(blob)
+            output = self.net.forward()
+        return yolo_predictions(output, width / self.input_size, height / self.input_size,
+                                self.confidence, self.nms_threshold, self.class_names)
+
+class DetectionPipeline:
+    """
+    Deteccao assincrona: ate max_in_flight frames sao enviados ao detector ao mesmo tempo, em threads,
+    sem bloquear o loop. Os resultados chegam fora de ordem, cada um com o indice do seu frame,
+    para serem associados a telemetria daquele frame.
+    """
+    def __init__(self, detector, max_in_flight=4):
+        self.detector = detector
+        self.max_in_flight = max_in_flight
+        self.executor = ThreadPoolExecutor(max_workers=max_in_flight)
+        self.in_flight = set()
+        self.done = queue.Queue()
+
+    def __len__(self):
+        return len(self.in_flight)
+
+    def submit(self, frame_index, image):
+        """
+        Envia o frame se houver espaco na janela de requisicoes. A imagem nao deve ser alterada depois.
+
+        :return: True se o frame foi enviado
+        """
+        if len(self.in_flight) >= self.max_in_flight:
+            return False
+        future = self.executor.submit(self.detector.detect, image, frame_index)
+        self.in_flight.add(future)
+        future.add_done_callback(lambda future: self.done.put((frame_index, future)))
+        return True
+
+    def results(self):
+        """ :return: Lista de (frame_index, predicoes) das requisicoes concluidas desde a ultima chamada """
+        results = []
+        while True:
+            try:
+                frame_index, future = self.done.get_nowait()
+            except queue.Empty:
+                break
+            self.in_flight.discard(future)
+            try:
+                results.append((frame_index, future.result()))
+            except Exception as e:
+                print(f"Erro na deteccao do frame {frame_index}: {e}")
+        return results
+
+    def close(self):
+        # Espera as requisicoes em andamento antes de fechar o detector (e o cache, se houver)
+        self.executor.shutdown(wait=True, cancel_futures=True)
+        if hasattr(self.detector, 'close'):
+            self.detector.close()
+
+def model_identity(model_path):
+    """ sha1 do arquivo do modelo inteiro, que identifica o modelo no cache de deteccoes. """
+    sha1 = hashlib.sha1()
+    with open(model_path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1 << 20), b''):
+            sha1.update(chunk)
+    return sha1.hexdigest()
+
+def video_identity(video_path):
+    """ Identificador do video sem ler o arquivo inteiro: tamanho e sha1 do primeiro e do ultimo MB. """
+    size = os.path.getsize(video_path)
+    sha1 = hashlib.sha1(str(size).encode())
+    with open(video_path, 'rb') as file:
+        sha1.update(file.read(1 << 20))
+        file.seek(max(0, size - (1 << 20)))
+        sha1.update(file.read(1 << 20))
+    return sha1.hexdigest()
+
+def image_hash(image):
+    """ Hash do conteudo de um frame (amostrado a cada 4 pixels), para conferir entradas do cache. """
+    return hashlib.blake2b(np.ascontiguousarray(image[::4, ::4]).tobytes(), digest_size=16).digest()
+
+class DetectionCache:
+    """
+    Resultados do detector gravados em SQLite, por (video, frame, modelo), com o hash do frame como
+    conferencia. Acima de max_mb as entradas usadas ha mais tempo sao removidas.
+
+    As consultas nao escrevem no banco: o ultimo uso das entradas lidas fica em memoria e e gravado
+    junto com o proximo put, a cada touch_batch leituras ou no close.
+    """
+    def __init__(self, db_path, max_mb=256, touch_batch=64):
+        self.max_bytes = max_mb * 1024 * 1024
+        self.touch_batch = touch_batch
+        self.touched = {}
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(db_path, check_same_thread=False)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS detections (video TEXT, frame INTEGER, model TEXT, hash BLOB, "
+                                "predictions BLOB, size INTEGER, last_used REAL, PRIMARY KEY (video, frame, model))")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS detections_last_used ON detections (last_used)")
+        self.connection.commit()
+        self.total_bytes = self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM detections").fetchone()[0]
+
+    def get(self, video, frame_index, model, content_hash):
+        with self.lock:
+            row = self.connection.execute("SELECT hash, predictions FROM detections WHERE video = ? AND frame = ? AND model = ?",
+                                          (video, frame_index, model)).fetchone()
+            if row is None or row[0] != content_hash:
+                return None
+            self.touched[(video, frame_index, model)] = time.time()
+            if len(self.touched) >= self.touch_batch:
+                self._write_touched()
+                self.connection.commit()
+        return json.loads(row[1])
+
+    def _write_touched(self):
+        self.connection.executemany("UPDATE detections SET last_used = ? WHERE video = ? AND frame = ? AND model = ?",
+                                    [(last_used,) + key for key, last_used in self.touched.items()])
+        self.touched.clear()
+
+    def put(self, video, frame_index, model, content_hash, predictions):
+        data = json.dumps(predictions, separators=(',', ':')).encode('utf-8')
+        size = len(data) + len(content_hash) + 64
+        with self.lock:
+            # Ultimos usos pendentes antes de uma possivel remocao por LRU
+            self._write_touched()
+            self.touched.pop((video, frame_index, model), None)
+            previous = self.connection.execute("SELECT size FROM detections WHERE video = ? AND frame = ? AND model = ?",
+                                               (video, frame_index, model)).fetchone()
+            self.connection.execute("INSERT OR REPLACE INTO detections VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                    (video, frame_index, model, content_hash, data, size, time.time()))
+            self.total_bytes += size - (previous[0] if previous else 0)
+            if self.total_bytes > self.max_bytes:
+                self._evict(int(self.max_bytes * 0.9))
+            self.connection.commit()
+
+    def _evict(self, target_bytes):
+        rows = self.connection.execute("SELECT rowid, size FROM detections ORDER BY last_used").fetchall()
+        removed = []
+        for rowid, size in rows:
+            if self.total_bytes <= target_bytes:
+                break
+            removed.append((rowid,))
+            self.total_bytes -= size
+        self.connection.executemany("DELETE FROM detections WHERE rowid = ?", removed)
+
+    def close(self):
+        with self.lock:
+            self._write_touched()
+            self.connection.commit()
+            self.connection.close()
+
+class CachedDetector:
+    """ Detector com cache em disco na frente: frames ja analisados nao sao enviados de novo. """
+    def __init__(self, detector, cache, video):
+        self.detector = detector
+        self.cache = cache
+        self.video = video
+        self.model_id = detector.model_id
+
+    def detect(self, image, frame_index=None):
+        if frame_index is None:
+            return self.detector.detect(image)
+        content_hash = image_hash(image)
+        predictions = self.cache.get(self.video, frame_index, self.model_id, content_hash)
+        if predictions is None:
+            predictions = self.detector.detect(image, frame_index)
+            self.cache.put(self.video, frame_index, self.model_id, content_hash, predictions)
+        return predictions
+
+    def close(self):
+        self.cache.close()
+
+def yolo_predictions(output, scale_x, scale_y, confidence=0.4, nms_threshold=0.45, class_names=None):
+    """
+    Converte a saida de um modelo YOLOv8 em predicoes, com supressao de nao maximos.
+
+    :param output: Array (1, 4 + classes, N) ou (1, N, 4 + classes)
+    :param scale_x: Razao entre a largura da imagem original e a da entrada do modelo
+    """
+    output = np.squeeze(output, axis=0)
+    if output.shape[0] < output.shape[1]:
+        output = output.T
+    scores = output[:, 4:]
+    class_ids = np.argmax(scores, axis=1)
+    confidences = scores[np.arange(len(class_ids)), class_ids]
+    keep = confidences >= confidence
+    boxes, class_ids, confidences = output[keep, :4], class_ids[keep], confidences[keep]
+    if len(boxes) == 0:
+        return []
+
+    boxes = boxes * [scale_x, scale_y, scale_x, scale_y]
+    corners = np.column_stack((boxes[:, 0] - boxes[:, 2] / 2, boxes[:, 1] - boxes[:, 3] / 2, boxes[:, 2], boxes[:, 3]))
+    indexes = np.array(cv2.dnn.NMSBoxes(corners.tolist(), confidences.tolist(), confidence, nms_threshold)).reshape(-1)
+
+    predictions = []
+    for i in indexes:
+        class_id = int(class_ids[i])
+        predictions.append({
+            'x': float(boxes[i, 0]), 'y': float(boxes[i, 1]), 'width': float(boxes[i, 2]), 'height': float(boxes[i, 3]),
+            'confidence': float(confidences[i]), 'class_id': class_id,
+            'class': class_names[class_id] if class_names is not None else str(class_id),
+        })
+    return predictions
+
+def create_detector(parameters, project_id="car-models-rr7w5", model_version=1):
+    """
+    Detector escolhido em parameters["detector"]: "onnx" (modelo local em detector_model_path)
+    ou "http" (padrao, api_url e api_key; imagem reduzida por detector_scale).
+    Com detector_cache_path (e video_path) os resultados ficam em cache em disco.
+    """
+    detector = create_backend(parameters, project_id, model_version)
+    if parameters.get("detector_cache_path") and "video_path" in parameters:
+        cache = DetectionCache(parameters["detector_cache_path"], max_mb=parameters.get("detector_cache_mb", 256))
+        detector = CachedDetector(detector, cache, video_identity(parameters["video_path"]))
+    return detector
+
+def create_backend(parameters, project_id="car-models-rr7w5", model_version=1):
+    backend = parameters.get("detector", "http")
+    if backend == "onnx":
+        return ONNXDetector(parameters["detector_model_path"], input_size=parameters.get("detector_input_size", 640),
+                            confidence=parameters.get("detector_confidence", 0.4), class_names=parameters.get("detector_classes"))
+    if backend == "http":
+        return HTTPDetector(parameters["api_url"], parameters["api_key"], f"{project_id}/{model_version}",
+                            scale=parameters.get("detector_scale", 6))
+    raise ValueError(f"Detector desconhecido: {backend}")
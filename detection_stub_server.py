@@ -0,0 +1,99 @@
+"""
+Servidor local que imita a API de inferencia, para testar a deteccao sem rede.
+
+Aceita as requisicoes do InferenceHTTPClient (POST /<projeto>/<versao> com a imagem em base64 ou
+POST /infer/object_detection com JSON, alem do registro de modelos em GET /model/registry e
+POST /model/add), espera --delay segundos e responde com um carro no centro da imagem recebida. Cada requisicao e atendida em uma thread, como um servidor com varias replicas.
+
+    python detection_stub_server.py --port 9001 --delay 0.5
+    (parameters.json: "detector": "http", "api_url": "http://localhost:9001", "api_key": "stub")
+"""
+import argparse
+import base64
+import json
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote_plus
+import cv2
+import numpy as np
+
+def decode_image(body):
+    """ Imagem enviada pelo cliente (base64 puro, formulario ou JSON), ou None se nao for possivel ler. """
+    try:
+        text = body.decode('ascii')
+        if text.lstrip().startswith('{'):
+            request = json.loads(text)
+            image = request.get('image', {})
+            image = image[0] if isinstance(image, list) else image
+            text = image.get('value', '')
+        elif '%' in text:
+            text = unquote_plus(text)
+        buffer = np.frombuffer(base64.b64decode(text), dtype=np.uint8)
+        return cv2.imdecode(buffer, cv2.IMREAD_COLOR)
+    except (ValueError, UnicodeDecodeError, AttributeError):
+        return None
+
+def stub_predictions(width, height):
+    return [{'x': width / 2, 'y': height / 2, 'width': width / 10, 'height': height / 10,
+             'confidence': 0.9, 'class': 'car', 'class_id': 0}]
+
+class StubHandler(BaseHTTPRequestHandler):
+    delay = 0.0
+    # Modelos "carregados" pelo cliente em /model/add
+    models = []
+
+    def send_json(self, payload):
+        response = json.dumps(payload).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(response)))
+        self.end_headers()
+        self.wfile.write(response)
+
+    def registry(self):
+        return {'models': [{'model_id': model_id, 'task_type': 'object-detection'} for model_id in self.models]}
+
+    def do_GET(self):
+        if self.path.split('?')[0] != '/model/registry':
+            self.send_error(404)
+            return
+        self.send_json(self.registry())
+
+    def do_POST(self):
+        start = time.perf_counter()
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if self.path.split('?')[0] == '/model/add':
+            model_id = json.loads(body).get('model_id')
+            if model_id not in self.models:
+                self.models.append(model_id)
+            self.send_json(self.registry())
+            return
+        image = decode_image(body)
+        height, width = image.shape[:2] if image is not None else (180, 320)
+        time.sleep(self.delay)
+        self.send_json({'predictions': stub_predictions(width, height),
+                        'image': {'width': width, 'height': height},
+                        'time': time.perf_counter() - start})
+
+    def log_message(self, format, *args):
+        pass
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Servidor de inferencia falso para testes locais.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9001)
+    parser.add_argument("--delay", type=float, default=0.5, help="Latencia simulada de cada requisicao em segundos")
+    args = parser.parse_args(argv)
+
+    StubHandler.delay = args.delay
+    server = ThreadingHTTPServer((args.host, args.port), StubHandler)
+    print(f"Servidor de inferencia falso em http://{args.host}:{args.port} (latencia {args.delay} s)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+import cv2
+import queue
+import threading
+from collections import OrderedDict
+
+class FrameStore:
+    """
+    Frames decodificados do video em um cache LRU limitado a cache_mb.
+
+    Uma thread decodifica o video em sequencia, ate prefetch frames a frente, em uma fila limitada.
+    Os frames da fila contam no limite de memoria: ate um quarto de cache_mb fica reservado para
+    eles (menos, se prefetch frames couberem em menos), e o cache LRU usa o restante.
+    read_next() consome o proximo frame da fila; get(index) devolve qualquer frame ja alcancado,
+    pedindo a thread que decodifique de novo (via CAP_PROP_POS_FRAMES) os que foram descartados.
+    Enquanto o video esta pausado nada e consumido, e a thread para assim que a fila enche.
+    """
+    def __init__(self, cap, cache_mb=2048, prefetch=32):
+        self.cap = cap
+        self.cache_bytes = cache_mb * 2**20
+        self.frames = OrderedDict()
+        self.frames_bytes = 0
+        self.decoded = 0  # Quantidade de frames ja consumidos em sequencia
+        self.finished = False
+        self.position = 0  # Proximo frame que o cap vai decodificar (usado so pela thread)
+
+        self.ahead = queue.Queue(maxsize=prefetch)
+        self.prefetch = prefetch
+        # Reserva da fila; ajustada ao tamanho real dos frames quando o primeiro e decodificado
+        self.ahead_limit = self.cache_bytes // 4
+        self.ahead_bytes = 0
+        self.ahead_lock = threading.Lock()
+        self.requests = queue.Queue()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._decode_loop, daemon=True)
+        self.thread.start()
+
+    def __len__(self):
+        return self.decoded + self.ahead.qsize()
+
+    def _store(self, index, image):
+        if index in self.frames:
+            self.frames.move_to_end(index)
+            return
+        self.frames[index] = image
+        self.frames_bytes += image.nbytes
+        while self.frames_bytes > self.cache_bytes - self.ahead_limit and len(self.frames) > 1:
+            _, evicted = self.frames.popitem(last=False)
+            self.frames_bytes -= evicted.nbytes
+
+    def _read_at(self, index):
+        if self.position != index:
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, index)
+        ret, image = self.cap.read()
+        self.position = index + 1 if ret else -1
+        return ret, image
+
+    def _decode_loop(self):
+        # Somente esta thread usa self.cap
+        next_index = 0
+        pending = None
+        eof_sent = False
+        while not self.stopped.is_set():
+            # Pedidos de frames fora da sequencia tem prioridade
+            try:
+                index, reply = self.requests.get(timeout=0.05 if eof_sent else 0)
+                reply.put(self._read_at(index))
+                continue
+            except queue.Empty:
+                pass
+            if eof_sent:
+                continue
+
+            if pending is None:
+                ret, image = self._read_at(next_index)
+                pending = (next_index, image if ret else None)  # None marca o fim do video
+                next_index += 1
+                if ret and next_index == 1:
+                    self.ahead_limit = min(self.ahead_limit, self.prefetch * image.nbytes)
+            size = pending[1].nbytes if pending[1] is not None else 0
+            with self.ahead_lock:
+                # Fila sem espaco na reserva de memoria: esperar o consumo (um frame sempre pode entrar)
+                full = self.ahead_bytes > 0 and self.ahead_bytes + size > self.ahead_limit
+                if not full:
+                    self.ahead_bytes += size
+            if full:
+                self.stopped.wait(0.01)
+                continue
+            try:
+                self.ahead.put(pending, timeout=0.05)
+                eof_sent = pending[1] is None
+                pending = None
+            except queue.Full:
+                with self.ahead_lock:
+                    self.ahead_bytes -= size
+
+    def read_next(self):
+        if self.finished:
+            return False, None
+        index, image = self.ahead.get()
+        if image is not None:
+            with self.ahead_lock:
+                self.ahead_bytes -= image.nbytes
+        if image is None:
+            self.finished = True
+            return False, None
+        self._store(index, image)
+        self.decoded += 1
+        return True, image
+
+    def get(self, index):
+        # Consumir a fila ate alcancar o frame pedido
+        while index >= self.decoded:
+            ret, _ = self.read_next()
+            if not ret:
+                raise IndexError(f"Frame {index} alem do fim do video")
+
+        if index in self.frames:
+            self.frames.move_to_end(index)
+            return self.frames[index]
+        if index < 0:
+            raise IndexError(f"Frame {index} invalido")
+
+        # Frame descartado do cache: pedir a thread para buscar e decodificar de novo
+        reply = queue.Queue(maxsize=1)
+        self.requests.put((index, reply))
+        ret, image = reply.get()
+        if not ret:
+            raise IndexError(f"Nao foi possivel decodificar o frame {index}")
+        self._store(index, image)
+        return image
+
+    def close(self):
+        self.stopped.set()
+        self.thread.join()
+        self.cap.release()
@@ -0,0 +1,191 @@
+import numpy as np
+import utm
+import dem
+
+# Frame; Erro; Altura do Drone; Distância do Drone; Click ENU; Click Pixel; Car Pixel; Drone ENU
+RESULT_HEADER = "Frame; Error; Drone Altitude; Drone-Car Distance; Click ENU; Click Pixel; Car Pixel; Drone ENU"
+
+def inv_K(K):
+    fx = K[0][0]
+    fy = K[1][1]
+    cx = K[0][2]
+    cy = K[1][2]
+    K_inv = np.array([[1/fx, 0, -cx/fx],
+             [0, 1/fy, -cy/fy],
+             [0, 0, 1]])
+    return K_inv
+
+def format_result(frame_index, click_ENU, click_pixel, h_rel, t_target, target_pixel, t_drone):
+    erro = np.linalg.norm(click_ENU.flatten() - t_target.flatten())
+    dist_drone = np.linalg.norm(t_drone.flatten() - t_target.flatten())
+    target_pixel = (float(target_pixel[0]), float(target_pixel[1]))
+    return f"{frame_index}; {erro}; {h_rel}; {dist_drone}; {click_ENU.flatten()}; {(click_pixel[0], click_pixel[1])}; {target_pixel}; {t_drone.flatten()}"
+
+class Geolocator:
+    """
+    Geolocalizacao de pixels: intersecao dos raios da camera com o DEM ou,
+    sem DEM, com o plano h = 0 do ENU.
+
+    As poses podem ser de um unico frame (R (3,3), t_drone (3,), h_abs escalar)
+    ou uma por pixel (R (N,3,3), t_drone (N,3), h_abs (N,)).
+    """
+    def __init__(self, K, lat0, lon0, h0, dem_pyramid=None):
+        self.K = K
+        self.K_inv = inv_K(K)
+        self.h0 = h0
+        self.utm0 = np.array(utm.from_latlon(lat0, lon0)[:2])
+        self.dem_pyramid = dem_pyramid
+        self.h_dem_offset = None
+
+        if dem_pyramid is not None:
+            h0_dem, inside = dem.get_DEM_alt_batch(dem_pyramid, dem_pyramid.transform, self.utm0[0], self.utm0[1])
+            if not inside:
+                raise Exception("Origem do sistema de coordenadas fora do mapa de elevação carregado!")
+            self.h_dem_offset = h0 - h0_dem.item()
+
+    def rays(self, R, pixels, up=True):
+        """ Direcoes (N,3) normalizadas dos raios dos pixels no ENU (invertidas para cima se up=True). """
+        pixels = np.asarray(pixels, dtype=np.float64).reshape(-1, 2)
+        pixels_RP2 = np.column_stack((pixels, np.ones(len(pixels))))
+        vecs = np.einsum('...ji,...j->...i', R, pixels_RP2 @ self.K_inv.T)
+        vecs = vecs / np.linalg.norm(vecs, axis=1, keepdims=True)
+        if up:
+            vecs[vecs[:, 2] < 0] *= -1
+        return vecs
+
+    def locate_with_status(self, pixels, R, t_drone, h_abs):
+        """
+        :param pixels: Array (N,2) de pixels (x, y)
+        :return: (points, status) - points (N,3) em ENU, com NaN onde o raio nao atinge o solo, e
+                 status (N,) com dem.DEM_HIT, dem.DEM_OUTSIDE (raio sai do DEM ou paralelo ao plano) ou dem.DEM_DIVERGED
+        """
+        vecs = self.rays(R, pixels)
+        t_drone = np.broadcast_to(np.asarray(t_drone, dtype=np.float64).reshape(-1, 3), vecs.shape)
+
+        if self.dem_pyramid is None:
+            # Intersecao com o plano h = 0 do ENU
+            with np.errstate(divide='ignore', invalid='ignore'):
+                s = np.where(vecs[:, 2] != 0, -t_drone[:, 2] / vecs[:, 2], np.nan)
+            points = t_drone + s[:, None] * vecs
+            points[:, 2] = np.where(np.isnan(s), np.nan, 0)
+            status = np.where(np.isnan(s), dem.DEM_OUTSIDE, dem.DEM_HIT).astype(np.int8)
+            return points, status
+
+        origins = np.column_stack((t_drone[:, :2] + self.utm0, np.broadcast_to(h_abs, len(vecs)) - self.h_dem_offset))
+        points, status = self.dem_pyramid.intersect(origins, vecs)
+        return points - [self.utm0[0], self.utm0[1], self.h0 - self.h_dem_offset], status
+
+    def locate(self, pixels, R, t_drone, h_abs):
+        """ Pontos ENU (N,3) dos pixels (N,2), com NaN onde o raio nao atinge o solo (ver locate_with_status). """
+        return self.locate_with_status(pixels, R, t_drone, h_abs)[0]
+
+    def prefetch(self, R, t_drone, h_abs, h_rel, width, height, max_distance=1000.0):
+        """ Carrega os blocos do DEM sob a pegada da camera (cantos da imagem no plano do solo abaixo do drone). """
+        if self.dem_pyramid is None:
+            return
+        corners = np.array([[0, 0], [width, 0], [0, height], [width, height]], dtype=np.float64)
+        vecs = self.rays(R, corners, up=False)
+        origin = np.array([t_drone[0] + self.utm0[0], t_drone[1] + self.utm0[1], h_abs - self.h_dem_offset])
+        with np.errstate(divide='ignore'):
+            dist = np.where(vecs[:, 2] < 0, h_rel / -vecs[:, 2], max_distance)
+        dist = np.clip(dist, 0, max_distance)
+        footprint = np.vstack((origin, origin + dist[:, None] * vecs))
+        self.dem_pyramid.prefetch(footprint[:, 0], footprint[:, 1])
+
+class GroundMap:
+    """
+    Mapa do solo de um frame: os raios de uma grade de pixels (a cada step pixels) sao intersectados
+    com o DEM uma vez, e qualquer pixel e geolocalizado por interpolacao bilinear na grade.
+
+    A grade so e montada para consultas densas (ao menos dense_fraction dos pixels amostrados) ou por
+    update(), e e reaproveitada enquanto a pose muda menos que max_rotation_deg e max_translation;
+    consultas esparsas com outra pose usam o Geolocator direto. Para cada celula tambem sao intersectados o centro e os
+    pontos medios das arestas; se algum deles ficar a mais de max_deviation da interpolacao (bordas de
+    predios, degraus do DEM, raios sem intersecao), os pixels da celula usam o calculo exato.
+    """
+    def __init__(self, geolocator, width, height, step=16, max_rotation_deg=0.01, max_translation=0.05, max_deviation=0.1,
+                 dense_fraction=0.05):
+        self.geolocator = geolocator
+        self.dense_fraction = dense_fraction
+        self.step = step
+        self.xs = np.arange(0, width + step, step, dtype=np.float64)
+        self.ys = np.arange(0, height + step, step, dtype=np.float64)
+        self.max_rotation = np.radians(max_rotation_deg)
+        self.max_translation = max_translation
+        self.max_deviation = max_deviation
+        self.pose = None
+        self.grid = None
+        self.reliable = None
+
+        # Pixels amostrados: cantos (rows, cols), centros, pontos medios das arestas horizontais e verticais
+        middle_xs, middle_ys = self.xs[:-1] + step / 2, self.ys[:-1] + step / 2
+        samples = [np.meshgrid(self.xs, self.ys), np.meshgrid(middle_xs, middle_ys),
+                   np.meshgrid(middle_xs, self.ys), np.meshgrid(self.xs, middle_ys)]
+        self.sample_shapes = [grid_x.shape for grid_x, _ in samples]
+        self.sample_pixels = np.concatenate([np.column_stack((grid_x.ravel(), grid_y.ravel())) for grid_x, grid_y in samples])
+
+    def _same_pose(self, R, t_drone, h_abs):
+        if self.pose is None:
+            return False
+        R_map, t_map, h_map = self.pose
+        angle = np.arccos(np.clip((np.trace(R @ R_map.T) - 1) / 2, -1.0, 1.0))
+        return angle <= self.max_rotation and np.linalg.norm(t_drone - t_map) <= self.max_translation and \
+            abs(h_abs - h_map) <= self.max_translation
+
+    def update(self, R, t_drone, h_abs):
+        """ Refaz a grade se a pose mudou alem dos limites; retorna True se a grade foi recalculada. """
+        R = np.asarray(R, dtype=np.float64)
+        t_drone = np.asarray(t_drone, dtype=np.float64).reshape(3)
+        if self._same_pose(R, t_drone, h_abs):
+            return False
+        points = self.geolocator.locate(self.sample_pixels, R, t_drone, h_abs)
+        sizes = np.cumsum([0] + [rows * cols for rows, cols in self.sample_shapes])
+        grid, centers, horizontal, vertical = [points[start:end].reshape(shape + (3,)) for start, end, shape in
+                                               zip(sizes[:-1], sizes[1:], self.sample_shapes)]
+        self.grid = grid
+
+        # Distancia entre o ponto exato e o interpolado no centro e no meio de cada aresta da celula; um
+        # degrau paralelo a uma aresta desloca dois cantos juntos e so aparece nesses pontos intermediarios
+        def deviation(exact, interpolated):
+            return np.linalg.norm(exact - interpolated, axis=-1)
+        center_deviation = deviation(centers, (grid[:-1, :-1] + grid[:-1, 1:] + grid[1:, :-1] + grid[1:, 1:]) / 4)
+        horizontal_deviation = deviation(horizontal, (grid[:, :-1] + grid[:, 1:]) / 2)
+        vertical_deviation = deviation(vertical, (grid[:-1] + grid[1:]) / 2)
+        # Cantos fora de um plano (p00 + p11 != p01 + p10): degrau na diagonal da celula
+        planar_deviation = deviation(grid[:-1, :-1] + grid[1:, 1:], grid[:-1, 1:] + grid[1:, :-1])
+        cell_deviation = np.maximum.reduce([planar_deviation, center_deviation, horizontal_deviation[:-1], horizontal_deviation[1:],
+                                            vertical_deviation[:, :-1], vertical_deviation[:, 1:]])
+        # NaN (raio sem intersecao em algum ponto) tambem torna a celula nao confiavel
+        with np.errstate(invalid='ignore'):
+            self.reliable = cell_deviation <= self.max_deviation
+        self.pose = (R, t_drone, h_abs)
+        return True
+
+    def locate(self, pixels, R, t_drone, h_abs):
+        """
+        Mesmo resultado de Geolocator.locate (a menos de max_deviation). Usa a grade se ela for da pose
+        dada ou se a consulta for densa (montando a grade); senao, o calculo exato.
+        """
+        pixels = np.asarray(pixels, dtype=np.float64).reshape(-1, 2)
+        if len(pixels) == 0:
+            return np.zeros((0, 3))
+        R = np.asarray(R, dtype=np.float64)
+        t_drone = np.asarray(t_drone, dtype=np.float64).reshape(3)
+        if not self._same_pose(R, t_drone, h_abs):
+            # Montar a grade (milhares de raios) so compensa para muitos pixels da mesma pose
+            if len(pixels) < self.dense_fraction * len(self.sample_pixels):
+                return self.geolocator.locate(pixels, R, t_drone, h_abs)
+            self.update(R, t_drone, h_abs)
+
+        u = np.clip(pixels[:, 0] / self.step, 0, len(self.xs) - 1 - 1e-9)
+        v = np.clip(pixels[:, 1] / self.step, 0, len(self.ys) - 1 - 1e-9)
+        column, row = u.astype(int), v.astype(int)
+        fu, fv = (u - column)[:, None], (v - row)[:, None]
+        points = (self.grid[row, column] * (1 - fu) * (1 - fv) + self.grid[row, column + 1] * fu * (1 - fv) +
+                  self.grid[row + 1, column] * (1 - fu) * fv + self.grid[row + 1, column + 1] * fu * fv)
+
+        inside = (pixels[:, 0] >= 0) & (pixels[:, 0] <= self.xs[-1]) & (pixels[:, 1] >= 0) & (pixels[:, 1] <= self.ys[-1])
+        exact = ~(inside & self.reliable[row, column])
+        if np.any(exact):
+            points[exact] = self.geolocator.locate(pixels[exact], R, t_drone, h_abs)
+        return points
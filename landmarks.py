@@ -0,0 +1,110 @@
+import re
+import numpy as np
+import pymap3d.enu as enu
+from pose import project
+
+def load_known_positions(file_path):
+    """
+    Le um arquivo de posicoes conhecidas no formato de tests/QuintaBoaVista/known-positions.txt:
+
+        Nome:
+            Latitude: -22.905551
+            Longitude: -43.221218
+            Altitude: 12.484
+
+    :return: (nomes, array (N,3) de latitude, longitude e altitude)
+    """
+    names = []
+    positions = []
+    current = {}
+    with open(file_path, 'r', encoding='utf-8') as file:
+        for line in file:
+            match = re.match(r'\s*(Latitude|Longitude|Altitude)\s*:\s*([-+\d.eE]+)', line)
+            if match:
+                current[match.group(1)] = float(match.group(2))
+            elif line.strip().endswith(':'):
+                names.append(line.strip()[:-1])
+                current = {}
+                positions.append(current)
+    valid = [i for i, position in enumerate(positions) if len(position) == 3]
+    geodetic = np.array([[positions[i]['Latitude'], positions[i]['Longitude'], positions[i]['Altitude']] for i in valid],
+                        dtype=np.float64).reshape(-1, 3)
+    return [names[i] for i in valid], geodetic
+
+class LandmarkRegistry:
+    """
+    Pontos de referencia em ENU, convertidos uma unica vez e indexados em uma grade regular
+    no plano (E, N). A cada frame so as celulas sob o volume visto pela camera sao consultadas.
+
+    Os pontos ficam ordenados pelo indice da celula (coluna * rows + linha), entao cada coluna
+    de celulas da consulta e uma faixa contigua do array.
+    """
+    def __init__(self, names, points_enu, cell_size=50.0):
+        points_enu = np.asarray(points_enu, dtype=np.float64).reshape(-1, 3)
+        self.cell_size = cell_size
+        self.origin = points_enu[:, :2].min(axis=0) if len(points_enu) else np.zeros(2)
+        cells = np.floor((points_enu[:, :2] - self.origin) / cell_size).astype(np.int64)
+        self.columns, self.rows = (cells.max(axis=0) + 1) if len(points_enu) else (0, 0)
+        cell_ids = cells[:, 0] * self.rows + cells[:, 1]
+        order = np.argsort(cell_ids, kind='stable')
+        self.cell_ids = cell_ids[order]
+        self.points = points_enu[order]
+        self.names = [names[i] for i in order]
+        self.z_range = (self.points[:, 2].min(), self.points[:, 2].max()) if len(points_enu) else (0.0, 0.0)
+
+    @classmethod
+    def from_file(cls, file_path, lat0, lon0, h0, cell_size=50.0):
+        names, geodetic = load_known_positions(file_path)
+        easting, northing, h_enu = enu.geodetic2enu(geodetic[:, 0], geodetic[:, 1], geodetic[:, 2], lat0, lon0, h0)
+        return cls(names, np.stack((easting, northing, h_enu), axis=1), cell_size)
+
+    def __len__(self):
+        return self.points.shape[0]
+
+    def query_box(self, east_min, north_min, east_max, north_max):
+        """ Indices dos pontos nas celulas que cruzam o retangulo dado. """
+        if len(self) == 0:
+            return np.zeros(0, dtype=np.int64)
+        c0, r0 = np.floor((np.array([east_min, north_min]) - self.origin) / self.cell_size).astype(np.int64)
+        c1, r1 = np.floor((np.array([east_max, north_max]) - self.origin) / self.cell_size).astype(np.int64)
+        c0, c1 = max(c0, 0), min(c1, self.columns - 1)
+        r0, r1 = max(r0, 0), min(r1, self.rows - 1)
+        if c0 > c1 or r0 > r1:
+            return np.zeros(0, dtype=np.int64)
+        columns = np.arange(c0, c1 + 1)
+        starts = np.searchsorted(self.cell_ids, columns * self.rows + r0, side='left')
+        ends = np.searchsorted(self.cell_ids, columns * self.rows + r1, side='right')
+        return np.concatenate([np.arange(start, end) for start, end in zip(starts, ends)])
+
+    def footprint(self, K, R, t, width, height, max_distance=1000.0, samples_per_edge=16):
+        """
+        Retangulo (E, N) que contem a parte do frustum da camera entre as alturas minima e maxima
+        dos pontos, limitada a max_distance da camera.
+        """
+        center = -R.T @ np.asarray(t, dtype=np.float64).reshape(3)
+        # Raios ao longo da borda da imagem: os cantos bastam quando todos atingem os planos, mas com o
+        # horizonte visivel o limite de distancia arredonda o volume entre eles
+        u = np.linspace(0, width, samples_per_edge + 1)
+        v = np.linspace(0, height, samples_per_edge + 1)
+        border = np.concatenate((np.stack((u, np.zeros_like(u)), axis=1), np.stack((u, np.full_like(u, height)), axis=1),
+                                 np.stack((np.zeros_like(v), v), axis=1), np.stack((np.full_like(v, width), v), axis=1)))
+        directions = np.hstack((border, np.ones((border.shape[0], 1)))) @ np.linalg.inv(K).T @ R
+        directions /= np.linalg.norm(directions, axis=1, keepdims=True)
+        points = [center]
+        for z in self.z_range:
+            with np.errstate(divide='ignore', invalid='ignore'):
+                s = (z - center[2]) / directions[:, 2]
+            s = np.where((s > 0) & (s < max_distance), s, max_distance)
+            points.append(center + s[:, None] * directions)
+        points = np.vstack(points)
+        return points[:, 0].min(), points[:, 1].min(), points[:, 0].max(), points[:, 1].max()
+
+    def visible(self, K, R, t, width, height, max_distance=1000.0):
+        """
+        Pontos de referencia dentro do frustum da camera no frame atual.
+
+        :return: (indices em self.points/self.names, pixels (M,2))
+        """
+        candidates = self.query_box(*self.footprint(K, R, t, width, height, max_distance))
+        pixels, _, inside = project(K, R, t, self.points[candidates], width, height)
+        return candidates[inside], pixels[inside]
@@ -1,39 +1,39 @@
 import cv2
-from inference_sdk import InferenceHTTPClient
 import numpy as np
-import re
 from collections import deque
 import json
+import sys
 import glfw
 from OpenGL.GL import *
-from OpenGL.GLU import *
 import pymap3d.enu as enu
 import tkinter as tk
 from tkinter import simpledialog
-import rasterio
-import utm
-
-droneToMundoR = np.array([[0,1,0],[1,0,0],[0,0,-1]])
-mundoToDroneR = np.transpose(droneToMundoR)
-cameraToDroneR = np.array([[0,0,1],[1,0,0],[0,1,0]])
-droneToCameraR = np.transpose(cameraToDroneR)
-cameraToMundoR = np.array([[1,0,0],[0,0,1],[0,-1,0]])
-mundoToCameraR = np.transpose(cameraToMundoR)
-cameraToOpenglR = np.array([[1,0,0],[0,-1,0],[0,0,-1]])
-
-lat0 = -22.905812 
-lon0 = -43.221329
-h0 = 12.456
-utm0_x, utm0_y, utm_zn, utm_zl = utm.from_latlon(lat0, lon0)
-
-dem_interception_epsilon = 0.01
-dem_interception_count = 50
+import dem
+from telemetry import parse_srt
+from frames import FrameStore
+from overlay import PBOReader, create_marker_renderer, scale_intrinsics, marker_boxes, OverlayCompositor
+from tracking import ROITracker, DetectionTracker, HomographyTracker, CPUTemplateMatcher, CudaTemplateMatcher
+from geolocate import Geolocator, GroundMap, inv_K, format_result
+from camera import load_camera, Undistorter
+from landmarks import LandmarkRegistry
+from attitude import roi_bearings, ransac_rotation
+from detection import create_detector, DetectionPipeline
+from pose import PoseTable, lat0, lon0, h0, cameraToOpenglR, project, project_points
 
 near = 0.1
 far = 1000.0
 cone_height = 5.0
 cone_radius = 1.5
 
+# Cores RGBA dos marcadores no OpenGL
+marker_color_values = {
+    "red": [1.0, 0.0, 0.0, 1.0],
+    "blue": [0.0, 0.0, 1.0, 1.0],
+    "green": [0.0, 1.0, 0.0, 1.0],
+    "black": [0.1, 0.1, 0.1, 1.0],
+    "yellow": [1.0, 1.0, 0.0, 1.0],
+}
+
 minimal_distance_param = 0.01
 
 roi_minimum_confidence = 0.65
@@ -65,243 +65,11 @@ def get_roi_data(i):
     h_abs_roi = simpledialog.askfloat(f"Entrada de dados {i}", f"Insira ALTITUDE do ROI {i} em relação ao nível do mar: ")
     return lat_roi, long_roi, h_abs_roi
 
-def inv_K(K):
-    fx = K[0][0]
-    fy = K[1][1]
-    cx = K[0][2]
-    cy = K[1][2]
-    K_inv = np.array([[1/fx, 0, -cx/fx],
-             [0, 1/fy, -cy/fy],
-             [0, 0, 1]])
-    return K_inv
-
 def norm_vec(v):
     v_copy = v.copy()
     norm_v = v_copy / np.linalg.norm(v_copy)
     return norm_v
 
-def parse_srt(file_path):
-    with open(file_path, 'r', encoding='utf-8') as file:
-        srt_content = file.read()
-
-    # Dividir o conteúdo em blocos por frame
-    frames = srt_content.strip().split('\n\n')
-    frame_data = []
-
-    for frame in frames:
-        lines = frame.split('\n')
-        
-        # Extraindo o índice do frame
-        frame_index = int(lines[0])
-        
-        # Extraindo o intervalo de tempo
-        time_range = lines[1].strip()
-        start_time, end_time = time_range.split(" --> ")
-
-        # Extraindo o DiffTime
-        match_difftime = re.search(r'DiffTime: (\d+)ms', lines[2])
-        diff_time_ms = int(match_difftime.group(1))
-
-        # Extraindo data e hora
-        data_time = lines[3]
-
-        # Extraindo dados
-        matches = re.findall(r'\[(.*?)\]', lines[4])
-        data = {}
-        for match in matches:
-            pairs = match.split()
-            for i in range(0, len(pairs) - 1):
-                if ':' in pairs[i]:
-                    key = pairs[i].replace(":", "")
-                    value = pairs[i+1]
-                    data[key] = value
-        
-        frame_data.append({
-                'frame_index': frame_index,
-                'start_time': start_time,
-                'end_time': end_time,
-                'diff_time_ms': diff_time_ms,
-                'data_time': data_time,
-                **data  # Mesclar informações extraídas dos colchetes
-            })
-
-    return frame_data
-
-def yaw_pitch_roll_to_rotation_matrix(yaw, pitch, roll):
-    # Converter ângulos de graus para radianos
-    yaw = np.radians(yaw)
-    pitch = np.radians(pitch)
-    roll = np.radians(roll)
-
-    # Matrizes de rotação básicas
-    Rz = np.array([
-        [np.cos(yaw), -np.sin(yaw), 0],
-        [np.sin(yaw),  np.cos(yaw), 0],
-        [0,            0,           1]
-    ])
-
-    Ry = np.array([
-        [np.cos(pitch), 0, np.sin(pitch)],
-        [0,             1, 0],
-        [-np.sin(pitch), 0, np.cos(pitch)]
-    ])
-
-    Rx = np.array([
-        [1, 0,           0],
-        [0, np.cos(roll), -np.sin(roll)],
-        [0, np.sin(roll),  np.cos(roll)]
-    ])
-
-    # Matriz de rotação composta: R = Rz * Ry * Rx
-    R = Rz @ Ry @ Rx
-    return R
-
-def find_DEM_intersection(utm_east, utm_north, utm_up, vec_flat_norm):
-    count = 0
-    while True:
-        alt = get_DEM_alt(utm_east, utm_north)
-        if alt is None:
-            return None
-        
-        gap = utm_up - alt
-        if np.abs(gap) <= dem_interception_epsilon:
-            return np.array([[utm_east], [utm_north], [utm_up]])
-        
-        vec = gap * vec_flat_norm
-        utm_east -= vec[0]
-        utm_north -= vec[1]
-        utm_up -= vec[2]
-        
-        count += 1
-        if count > dem_interception_count:
-            return None
-
-def find_ground_intersection(lat, lon, alt, vec):
-
-    # Descompactar vetor
-    x, y, z = vec
-
-    # Evitar divisão por zero no vetor
-    if z == 0:
-        raise ValueError("O vetor é paralelo ao solo e nunca tocará o chão.")
-
-    # Calcular t (tempo escalar para atingir o solo)
-    t = -alt / z
-
-    # Coordenadas deslocadas no plano cartesiano
-    x_t = t * x
-    y_t = t * y
-
-    # Conversão de deslocamento para latitude e longitude
-    new_lat = lat + (y_t / 111320)
-    new_lon = lon + (x_t / (111320 * np.cos(np.radians(lat))))
-
-    return new_lat, new_lon
-
-def find_ground_intersection_UTM(north, east, alt_rel, alt_abs, vec):
-
-    # Descompactar vetor
-    x = vec[0,0]
-    y = vec[1,0]
-    z = vec[2,0]
-
-    # Evitar divisão por zero no vetor
-    if z == 0:
-        raise ValueError("O vetor é paralelo ao solo e nunca tocará o chão.")
-
-    # Calcular t (tempo escalar para atingir o solo)
-    t = -alt_rel / z
-
-    # Coordenadas deslocadas no plano cartesiano
-    x_t = t * x
-    y_t = t * y
-
-    # Conversão de deslocamento para UTM
-    new_north = north + y_t
-    new_east = east + x_t
-
-    return np.array([[new_east], [new_north], [alt_abs - alt_rel]])
-
-def find_ground_intersection_ENU(north, east, alt, vec):
-
-    # Descompactar vetor
-    x = vec[0]
-    y = vec[1]
-    z = vec[2]
-
-    # Evitar divisão por zero no vetor
-    if z == 0:
-        raise ValueError("O vetor é paralelo ao solo e nunca tocará o chão.")
-
-    # Calcular t (tempo escalar para atingir o solo)
-    t = -alt / z
-
-    # Coordenadas deslocadas no plano cartesiano
-    x_t = t * x
-    y_t = t * y
-
-    # Conversão de deslocamento
-    new_north = north + y_t
-    new_east = east + x_t
-
-    return np.array([[new_east], [new_north], [0]])
-
-def find_ground_intersection_ECEF(lat, lon, alt, vec, earth_radius=6371000):
-    """
-    Encontra a latitude e longitude onde o vetor atinge o solo, considerando a curvatura da Terra.
-    
-    :param lat: Latitude inicial em graus
-    :param lon: Longitude inicial em graus
-    :param alt: Altitude inicial em metros
-    :param vec: Vetor (x, y, z) representando a direção
-    :param earth_radius: Raio da Terra em metros
-    :return: Nova latitude e longitude em graus
-    """
-    # Converter latitude, longitude e altitude para coordenadas ECEF (Earth-Centered, Earth-Fixed)
-    lat_rad = np.radians(lat)
-    lon_rad = np.radians(lon)
-    x0 = (earth_radius + alt) * np.cos(lat_rad) * np.cos(lon_rad)
-    y0 = (earth_radius + alt) * np.cos(lat_rad) * np.sin(lon_rad)
-    z0 = (earth_radius + alt) * np.sin(lat_rad)
-    
-    # Direção do vetor
-    dx, dy, dz = vec
-    
-    # Resolver interseção do vetor com a superfície esférica da Terra
-    # |P + t * D|^2 = R^2
-    # P = (x0, y0, z0), D = (dx, dy, dz), R = earth_radius
-    # Substituindo: (x0 + t*dx)^2 + (y0 + t*dy)^2 + (z0 + t*dz)^2 = R^2
-    a = dx**2 + dy**2 + dz**2
-    b = 2 * (x0 * dx + y0 * dy + z0 * dz)
-    c = x0**2 + y0**2 + z0**2 - earth_radius**2
-
-    # Resolver a equação quadrática
-    discriminant = b**2 - 4 * a * c
-    if discriminant < 0:
-        raise ValueError("O vetor não atinge a superfície da Terra.")
-
-    # Escolher a menor solução positiva para t (interseção com o solo)
-    t = (-b - np.sqrt(discriminant)) / (2 * a)
-    if t < 0:
-        raise ValueError("O vetor não aponta para a superfície da Terra.")
-
-    # Coordenadas do ponto de interseção em ECEF
-    xi = x0 + t * dx
-    yi = y0 + t * dy
-    zi = z0 + t * dz
-
-    # Converter de ECEF de volta para latitude e longitude
-    new_lat = np.degrees(np.arcsin(zi / earth_radius))
-    new_lon = np.degrees(np.arctan2(yi, xi))
-
-    return new_lat, new_lon
-
-def reta3D(K_inv, R_t, t, pixel):
-    pixel_RP2 = np.array([[pixel[0]], [pixel[1]], [1]])
-    p0 = - R_t @ t
-    pv = R_t @ K_inv @ pixel_RP2
-    return (p0, pv)
-
 def desenhar_centro(image, center_x, center_y, cor, roi_flag=False):
     if (not glMode) or roi_flag:
         line_length = 10
@@ -355,112 +123,6 @@ def build_projection_matrix(K, width, height, near=near, far=far):
     proj[3, 2] = -1
     return proj
 
-def build_view_matrix(R, t):
-    """ Converte R e t para uma matriz de visualização do OpenGL. """
-    R_T = np.transpose(R)
-    Rt = np.concatenate((R_T, -R_T @ t), axis=1)
-    view = np.eye(4)  # Matriz identidade 4x4
-    view[:3, :4] = Rt  # Insere [R | t] na matriz 4x4
-    return view
-
-def draw_cone_sphere(x, y, z, pitch, color):
-
-    color_array = [0.0, 0.0, 0.0, 1.0]
-    if color == "red":
-        color_array = [1.0, 0.0, 0.0, 1.0]
-    elif color == "blue":
-        color_array = [0.0, 0.0, 1.0, 1.0]
-    elif color == "green":
-        color_array = [0.0, 1.0, 0.0, 1.0]
-    elif color == "black":
-        color_array = [0.1, 0.1, 0.1, 1.0]
-
-    # Esfera vermelha
-    glMaterialfv(GL_FRONT, GL_AMBIENT, color_array)
-    glMaterialfv(GL_FRONT, GL_DIFFUSE, color_array)
-    glMaterialfv(GL_FRONT, GL_SPECULAR, [1.0, 1.0, 1.0, 1.0])
-    glMaterialf(GL_FRONT, GL_SHININESS, 50.0)
-
-    sphere_quadric = gluNewQuadric()
-    glPushMatrix()
-    glTranslatef(x, y, z)  # **Posicionar no local correto**
-    gluSphere(sphere_quadric, cone_radius, 20, 20)
-    glPopMatrix()
-
-    # Desabilitar o plano de corte
-    glDisable(GL_CLIP_PLANE0)
-
-    # Cone
-    cone_quadric = gluNewQuadric()
-    glPushMatrix()
-    glTranslatef(x, y, z)  # **Mesmo posicionamento para o cone**
-    glRotatef(90 - pitch, 1, 0, 0)
-    gluCylinder(cone_quadric, cone_radius, 0, cone_height, 20, 20)
-    glPopMatrix()
-
-def render(draw_func):
-
-    if glMode:
-        glLoadIdentity()
-        draw_func()
-
-def draw_opengl(pixels_opengl, imagem_fundo):
-    # Capturar a tela do OpenGL
-    imagem_renderizada = np.frombuffer(pixels_opengl, dtype=np.uint8).reshape(1080, 1920, 3)
-    imagem_renderizada = cv2.flip(imagem_renderizada, 0)
-    imagem_renderizada = cv2.cvtColor(imagem_renderizada, cv2.COLOR_RGB2BGR)  # Converter RGB → BGR
-
-    # Criar uma máscara onde os pixels pretos indicam transparência
-    gray = cv2.cvtColor(imagem_renderizada, cv2.COLOR_BGR2GRAY)  # Converter para tons de cinza
-    _, mask = cv2.threshold(gray, 1, 255, cv2.THRESH_BINARY)  # Criar máscara: 0 para preto, 255 para o resto
-
-    # Inverter a máscara para pegar apenas o fundo
-    mask_inv = cv2.bitwise_not(mask)
-
-    # Criar uma versão da imagem de fundo com buraco onde os objetos estão
-    fundo_com_buraco = cv2.bitwise_and(imagem_fundo, imagem_fundo, mask=mask_inv)
-
-    # Criar uma versão da renderização que mantém apenas os objetos
-    objetos_renderizados = cv2.bitwise_and(imagem_renderizada, imagem_renderizada, mask=mask)
-
-    # Combinar as duas imagens corretamente
-    resultado = cv2.add(fundo_com_buraco, objetos_renderizados)
-    return resultado
-
-def get_homography(frame_base, frame_obj, detector, matcher):
-    kp_base, des_base = detector.detectAndCompute(frame_base, None)
-    kp_obj, des_obj = detector.detectAndCompute(frame_obj, None)
-    
-    matches = matcher.match(des_base, des_obj)
-    matches = sorted(matches, key=lambda x: x.distance)
-    num_matches = 50
-    matches = matches[:num_matches]
-
-    src_pts = np.float32([kp_base[m.queryIdx].pt for m in matches]).reshape(-1,1,2)
-    dst_pts = np.float32([kp_obj[m.trainIdx].pt for m in matches]).reshape(-1,1,2)
-
-    H, mask = cv2.findHomography(src_pts, dst_pts, cv2.RANSAC, 5.0)
-
-    return H
-
-def distance_is_minimal(east_0, north_0, h_0, east_1, north_1, h_1):
-    point_0 = np.array([east_0, north_0, h_0])
-    point_1 = np.array([east_1, north_1, h_1])
-    distance = np.linalg.norm(point_1 - point_0)
-    if distance < h_1 * minimal_distance_param:
-        return True
-    else:
-        return False
-
-def get_DEM_alt(east_utm, north_utm):
-    row, col = ~dem_transform * (east_utm, north_utm)
-    row = int(round(row))
-    col = int(round(col))
-    if 0 <= row < dem_elevation_data.shape[0] and 0 <= col < dem_elevation_data.shape[1]:
-        return dem_elevation_data[row, col]
-    else:
-        return None  # Fora da imagem
-
 def get_R_one_roi(roi_enu, roi_pixel, R, K_inv, t_drone_ENU):    
     theta_1, R_1 = get_rotation_from_vectors(R @ (roi_enu - t_drone_ENU), K_inv @ roi_pixel)
     theta_2, R_2 = get_rotation_from_vectors(R @ (roi_enu - t_drone_ENU), - K_inv @ roi_pixel)
@@ -472,32 +134,25 @@ def get_R_one_roi(roi_enu, roi_pixel, R, K_inv, t_drone_ENU):
     return R_corr @ R
 
 def get_R_roi(roi_enus, roi_pixels, K_inv, t_drone_ENU):
-    if len(roi_enus) > 2:
-        print("CORRECAO PARA 3 OU MAIS ROI AINDA A IMPLEMENTAR")
-        print("CONSIDERAMOS SOMENTE OS DOIS PRIMEIROS ROI")
-    
-    a_list = [(lambda a: norm_vec(a - t_drone_ENU))(a) for a in roi_enus]
-    b_list = [(lambda b: norm_vec(K_inv @ b))(b) for b in roi_pixels]
-
-    u_0 = a_list[0]
-    u_1 = norm_vec(a_list[1] - (np.dot(a_list[1].copy().flatten(), u_0.copy().flatten())) * u_0)
-    u_2_flat = np.cross(u_0.copy().flatten(), u_1.copy().flatten())
-    u_2 = np.array([[u_2_flat[0]],[u_2_flat[1]],[u_2_flat[2]]])
-    
-    v_0 = b_list[0]
-    v_1 = norm_vec(b_list[1] - (np.dot(b_list[1].copy().flatten(), v_0.copy().flatten())) * v_0)
-    v_2_flat = np.cross(v_0.copy().flatten(), v_1.copy().flatten())
-    v_2 = np.array([[v_2_flat[0]],[v_2_flat[1]],[v_2_flat[2]]])
-
-    A = np.concatenate((u_0, u_1, u_2), axis=1)
-    B = np.concatenate((v_0, v_1, v_2), axis=1)
-
-    return B @ np.transpose(A)
-
-def instantiate(K, R, t, point, color, t_drone_ENU, pitch):
-    pixel = K @ np.concatenate((R, t), axis=1) @ np.vstack((point, [1]))
-    pixel = pixel.flatten()
-    pixel = pixel / pixel[2]
+    # Todos os ROIs bons: hipoteses por pares de ROIs, rejeicao de outliers e ajuste SVD com os inliers
+    a, b = roi_bearings(K_inv, np.reshape(roi_enus, (1, -1, 3)), np.reshape(roi_pixels, (1, -1, 3))[..., :2],
+                        np.reshape(t_drone_ENU, (1, 3)))
+    R_roi, _ = ransac_rotation(a, b)
+    return R_roi[0]
+
+def draw_predictions(image, predictions, predictions_ENU, cor=(0, 0, 255)):
+    for prediction, prediction_ENU in zip(predictions, predictions_ENU):
+        x, y = int(prediction['x'] - prediction['width'] / 2), int(prediction['y'] - prediction['height'] / 2)
+        x2, y2 = int(x + prediction['width']), int(y + prediction['height'])
+        cv2.rectangle(image, (x, y), (x2, y2), cor, 3)
+        desenhar_centro(image, int(prediction['x']), int(prediction['y']), cor)
+        if not np.isnan(prediction_ENU).any():
+            print_on_pixel(image, f"N:{prediction_ENU[1]:.3f}, E:{prediction_ENU[0]:.3f}", x, y, cor)
+
+def instantiate(K, R, t, points, color, t_drone_ENU):
+    # Todos os pontos (M,3) de uma cor projetados de uma vez
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+    pixels, _, visible = project(K, R, t, points, original_width, original_height)
     if color == "red":
         colorN = (0,0,255)
     elif color == "black":
@@ -506,123 +161,153 @@ def instantiate(K, R, t, point, color, t_drone_ENU, pitch):
         colorN = (255,0,0)
     elif color == "green":
         colorN = (0,255,0)
+    elif color == "yellow":
+        colorN = (0,255,255)
 
-    desenhar_centro(image, int(pixel[0]), int(pixel[1]), colorN)
-    print_on_pixel(image, f"N:{point[1,0]:.3f}, E:{point[0,0]:.3f}, Up: {point[2,0]:.3f}", int(pixel[0]), int(pixel[1]), colorN)
-    t_opengl = cameraToOpenglR @ R @ (point - t_drone_ENU + [[0],[0],[cone_height]])
-    view_matrix = build_view_matrix(cameraToOpenglR @ R, np.array([[0],[0],[0]]))
-    glMatrixMode(GL_MODELVIEW)
-    glLoadMatrixf(view_matrix)
-    render(lambda: draw_cone_sphere(t_opengl[0,0], t_opengl[1,0], t_opengl[2,0], pitch, color))
+    for point, pixel in zip(points[visible], pixels[visible]):
+        desenhar_centro(image, int(pixel[0]), int(pixel[1]), colorN)
+        print_on_pixel(image, f"N:{point[1]:.3f}, E:{point[0]:.3f}, Up: {point[2]:.3f}", int(pixel[0]), int(pixel[1]), colorN)
+    if glMode:
+        # Os marcadores so sao acumulados aqui; todos sao desenhados de uma vez no fim do frame
+        t_opengl = (points - np.reshape(t_drone_ENU, (1, 3)) + [0, 0, cone_height]) @ (cameraToOpenglR @ R).T
+        marker_positions.extend(t_opengl)
+        marker_colors.extend([marker_color_values.get(color, [0.0, 0.0, 0.0, 1.0])] * len(t_opengl))
 
 
 with open("parameters.json", "r") as json_file:
     parameters = json.load(json_file)
 
-K_path = parameters["K_path"]
-with open(K_path, "r") as json_file:
-    K = np.array(json.load(json_file), dtype=np.float64)
+# K e, se houver no arquivo, os coeficientes de distorcao da lente
+K, dist_coeffs = load_camera(parameters["K_path"])
 
 dem_elevation_data = None
 try:
     tif_path = parameters["tif_path"]
-    with rasterio.open(tif_path) as dem_dataset:
-        dem_elevation_data = dem_dataset.read(1)
-        dem_transform = dem_dataset.transform
-        dem_crs = dem_dataset.crs
+    # DEM lido sob demanda em blocos, com cache LRU limitado
+    dem_elevation_data = dem.TiledDEM(tif_path, cache_mb=parameters.get("dem_cache_mb", 256))
 except Exception as e:
     print(f"Error: {e}\nConsidering flat terrain...")
 
-if dem_elevation_data is not None:
-    h0_dem = get_DEM_alt(utm0_x, utm0_y)
-    if h0_dem is not None:
-        h_dem_offset = h0 - h0_dem
-    else:
-        raise Exception("Origem do sistema de coordenadas fora do mapa de elevação carregado!")
-
 # Inicializar GLFW
 if not glfw.init():
     raise Exception("GLFW não pôde ser inicializado!")
 
 cuda_count = cv2.cuda.getCudaEnabledDeviceCount()
-gsrc = cv2.cuda.GpuMat()
-gtemplate = cv2.cuda.GpuMat()
-gresult = cv2.cuda.GpuMat()
 if cuda_count != 0:
     print("CUDA enabled")
-    cuda_matcher = cv2.cuda.createTemplateMatching(cv2.CV_8UC1, cv2.TM_CCOEFF_NORMED)
+    template_matcher = CudaTemplateMatcher()
+else:
+    template_matcher = CPUTemplateMatcher()
+
+original_width = 1920
+original_height = 1080
+resized_width = parameters["resized_width"]
+resized_height = parameters["resized_height"]
+scale_x = original_width / resized_width
+scale_y = original_height / resized_height
+
+# Com distorcao, a imagem exibida e a sem distorcao (mapas calculados uma vez), coerente com a K pinhole
+undistorter = None
+if dist_coeffs is not None:
+    undistorter = Undistorter(K, dist_coeffs, original_width, original_height)
+
+# Escala da renderizacao do overlay: por padrao na resolucao exibida; 1.0 renderiza em resolucao original (exportacao)
+render_scale = parameters.get("overlay_render_scale", resized_width / original_width)
+render_width = int(round(original_width * render_scale))
+render_height = int(round(original_height * render_scale))
+K_render = scale_intrinsics(K, render_width / original_width)
 
 # Criar janela OpenGL
-window = glfw.create_window(1920, 1080, "Render 3D", None, None)
+# Framebuffer com canal alfa: a renderizacao ja sai com a transparencia do fundo
+glfw.window_hint(glfw.ALPHA_BITS, 8)
+# Contexto 3.3 para os shaders dos marcadores (no macOS so existe o perfil core)
+glfw.window_hint(glfw.CONTEXT_VERSION_MAJOR, 3)
+glfw.window_hint(glfw.CONTEXT_VERSION_MINOR, 3)
+if sys.platform == "darwin":
+    glfw.window_hint(glfw.OPENGL_PROFILE, glfw.OPENGL_CORE_PROFILE)
+    glfw.window_hint(glfw.OPENGL_FORWARD_COMPAT, True)
+else:
+    glfw.window_hint(glfw.OPENGL_PROFILE, glfw.OPENGL_COMPAT_PROFILE)
+window = glfw.create_window(render_width, render_height, "Render 3D", None, None)
+if not window:
+    # Driver sem OpenGL 3.3: contexto padrao, com os marcadores no pipeline fixo
+    glfw.default_window_hints()
+    glfw.window_hint(glfw.ALPHA_BITS, 8)
+    window = glfw.create_window(render_width, render_height, "Render 3D", None, None)
+if not window:
+    raise Exception("Janela OpenGL não pôde ser criada!")
 glfw.make_context_current(window)
+glClearColor(0.0, 0.0, 0.0, 0.0)
 
 glEnable(GL_DEPTH_TEST)
 
-# Ativar iluminação
-glEnable(GL_LIGHTING)
-
-# Criar e ativar uma luz
-glEnable(GL_LIGHT0)
-
-# Definir a posição da luz (x, y, z, w)
-light_position = [0, 3, 3, 1]  # (x=0, y=3, z=3, w=1 para luz pontual)
-glLightfv(GL_LIGHT0, GL_POSITION, light_position)
+# Configurar matriz de projeção
+proj_matrix = build_projection_matrix(K_render, render_width, render_height)
+# Inverter o eixo y na projecao: as linhas lidas do OpenGL ja ficam na ordem da imagem (sem cv2.flip)
+proj_matrix = np.diag([1, -1, 1, 1]) @ proj_matrix
+# A inversao troca a orientacao dos triangulos na tela
+glFrontFace(GL_CW)
 
-# Definir intensidade da luz ambiente, difusa e especular
-light_ambient = [0.2, 0.2, 0.2, 1.0]  # Luz fraca no ambiente
-light_diffuse = [0.8, 0.8, 0.8, 1.0]  # Luz principal
-light_specular = [1.0, 1.0, 1.0, 1.0]  # Reflexo especular forte
+# Malhas dos marcadores enviadas uma vez para a GPU, com a mesma iluminacao do pipeline fixo
+# (ou o proprio pipeline fixo, se o contexto nao compilar os shaders)
+marker_renderer = create_marker_renderer(cone_radius, cone_height)
 
-glLightfv(GL_LIGHT0, GL_AMBIENT, light_ambient)
-glLightfv(GL_LIGHT0, GL_DIFFUSE, light_diffuse)
-glLightfv(GL_LIGHT0, GL_SPECULAR, light_specular)
+# Anel de PBOs para ler a renderizacao sem bloquear o loop
+overlay_reader = PBOReader(render_width, render_height, channels=4, count=parameters.get("overlay_pbo_count", 2))
+overlay_compositor = OverlayCompositor()
 
-# Ativar normalização de vetores normais (evita distorções)
-glEnable(GL_NORMALIZE)
+K_inv = inv_K(K)
 
-# Configurar matriz de projeção
-proj_matrix = build_projection_matrix(K, 1920, 1080)
-glMatrixMode(GL_PROJECTION)
-glLoadMatrixf(np.transpose(proj_matrix))
+# O DEM em blocos ja mantem a piramide de maximos usada na intersecao dos raios
+geolocator = Geolocator(K, lat0, lon0, h0, dem_pyramid=dem_elevation_data)
 
-K_inv = inv_K(K)
+# Mapa do solo por frame (grade a cada ground_map_step pixels), opcional: geolocalizacao densa por interpolacao
+# A grade so e montada para consultas densas; poucos cliques ou deteccoes de outro frame usam o calculo exato
+ground_map = None
+pixel_locator = geolocator
+if "ground_map_step" in parameters:
+    ground_map = GroundMap(geolocator, original_width, original_height, step=parameters["ground_map_step"])
+    pixel_locator = ground_map
 
 project_id = "car-models-rr7w5"
 model_version = 1
-api_key = parameters["api_key"]
-api_url = parameters["api_url"]
 
-client = InferenceHTTPClient(api_url=api_url, api_key=api_key)
+# Deteccao opcional: "detector" nos parametros escolhe o modelo local (onnx) ou a API remota (http)
+# As requisicoes ficam em paralelo (detector_in_flight) e os resultados chegam alguns frames depois
+detection_pipeline = None
+if "detector" in parameters:
+    detection_pipeline = DetectionPipeline(create_detector(parameters, project_id, model_version),
+                                           max_in_flight=parameters.get("detector_in_flight", 4))
+# Deteccao a cada detector_interval frames (ou quando uma trilha se perde); nos outros frames as caixas seguem a pose
+detection_tracker = DetectionTracker(interval=parameters.get("detector_interval", 5))
+detection_frame_index = None
 
 source = parameters["video_path"]
 cap = cv2.VideoCapture(source)
+# Frames decodificados em uma thread a parte, com memoria limitada; frames descartados sao decodificados de novo
+frames = FrameStore(cap, cache_mb=parameters.get("frame_cache_mb", 2048), prefetch=parameters.get("frame_prefetch", 32))
 
 frame_info = parse_srt(parameters["video_data_path"])
+# Rotacoes e translacoes da camera de todos os frames, calculadas uma unica vez
+poses = PoseTable(frame_info, lat0, lon0, h0)
 frame_index = 0
 
-original_width = 1920
-original_height = 1080
-resized_width = parameters["resized_width"]
-resized_height = parameters["resized_height"]
-scale_x = original_width / resized_width
-scale_y = original_height / resized_height
 window_name = "Locate"
 
-# # Homography stuff
-# frame_gap = 10
-# orb = cv2.ORB_create(nfeatures=1000)
-# bf = cv2.BFMatcher(cv2.NORM_HAMMING, crossCheck=True)
+# Atitude refinada por homografia (KLT a partir de um frame chave), opcional
+homography_tracker = None
+if parameters.get("homography_refinement", False):
+    homography_tracker = HomographyTracker(K, max_translation=minimal_distance_param)
 
 get_roi = False
-image_roi_gray_list = []
-roi_data_list = []
+# ROIs rastreados em uma janela em torno da posicao prevista; frame inteiro so quando a similaridade cai
+roi_tracker = ROITracker(roi_minimum_confidence, matcher=template_matcher)
+roi_enu_list = []
 roi_pixel_list = []
 roi_confidence_list = []
 good_roi_list = []
 good_roi_data_list = []
 
-scale_reduct_inference = 6
-
 clicks = deque(maxlen=10)
 clicks_ENU = deque(maxlen=10)
 
@@ -630,27 +315,32 @@ clicks_ENU = deque(maxlen=10)
 car_x, car_y, car_z = enu.geodetic2enu(-22.905551, -43.221218, 12.484, lat0, lon0, h0)
 t_car_mundo = np.array([[car_x],[car_y],[car_z]])
 
+# Posicoes conhecidas (ex.: tests/QuintaBoaVista/known-positions.txt), convertidas para ENU e indexadas uma unica vez
+landmarks = None
+if "landmarks_path" in parameters:
+    landmarks = LandmarkRegistry.from_file(parameters["landmarks_path"], lat0, lon0, h0)
+
 play = True
-images = []
 while not glfw.window_should_close(window):
     
     glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
+    marker_positions = []
+    marker_colors = []
 
-    ret, image = cap.read()
-    if ret:
-        images.append(image)
-        if play:
+    if play:
+        ret, image = frames.read_next()
+        if ret:
             frame_index += 1
 
     key = cv2.waitKey(1)
     if key & 0xFF == ord('q'):
         break
     elif key & 0xFF == ord('d'):
-        if frame_index + 1 < len(images):
+        if frame_index + 1 < len(frames):
             frame_index += 1
         continue
     elif key & 0xFF == ord('f'):
-        if frame_index + 10 < len(images):
+        if frame_index + 10 < len(frames):
             frame_index += 10
         continue
     elif key & 0xFF == ord('a'):
@@ -667,7 +357,13 @@ while not glfw.window_should_close(window):
     elif key & 0xFF == ord(' '):
         play = not play
     
-    image = images[frame_index - 1 if frame_index > 0 else 0].copy()
+    frame = frames.get(frame_index - 1 if frame_index > 0 else 0)
+    image = undistorter.image(frame) if undistorter is not None else frame.copy()
+    # O frame do cache nao e alterado, entao pode ir para o detector sem copia
+    if detection_pipeline is not None and frame_index != detection_frame_index and detection_tracker.needs_detection(frame_index):
+        if detection_pipeline.submit(frame_index, frame):
+            detection_frame_index = frame_index
+            detection_tracker.requested(frame_index)
     image_gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
     roi_pixel_list.clear()
     roi_confidence_list.clear()
@@ -675,45 +371,25 @@ while not glfw.window_should_close(window):
     good_roi_data_list.clear()
     R_roi = None
 
-    yaw = float(frame_info[frame_index]['gb_yaw'])
-    pitch = float(frame_info[frame_index]['gb_pitch'])
-    roll = float(frame_info[frame_index]['gb_roll'])
-    R_drone = yaw_pitch_roll_to_rotation_matrix(yaw, pitch, roll)
-    R_drone_T = np.transpose(R_drone)
-
-    h_rel = float(frame_info[frame_index]['rel_alt'])
-    h_abs = float(frame_info[frame_index]['abs_alt'])
-    lat = float(frame_info[frame_index]['latitude'])
-    long = float(frame_info[frame_index]['longitude'])
-
-    easting, northing, h_enu = enu.geodetic2enu(lat, long, h_abs, lat0, lon0, h0)
-
-    # # Homography stuff
-    # R_alt = None
-    # homography_index = frame_index - frame_gap if frame_index > frame_gap + 1 else None
-    # if homography_index is not None:
-    #     image_base = images[homography_index - 1].copy()
-    #     lat_base = float(frame_info[homography_index]['latitude'])
-    #     long_base = float(frame_info[homography_index]['longitude'])
-    #     h_abs_base = float(frame_info[homography_index]['abs_alt'])
-    #     yaw_base = float(frame_info[homography_index]['gb_yaw'])
-    #     pitch_base = float(frame_info[homography_index]['gb_pitch'])
-    #     roll_base = float(frame_info[homography_index]['gb_roll'])
-
-    #     R_drone_base = yaw_pitch_roll_to_rotation_matrix(yaw_base, pitch_base, roll_base)
-    #     R_drone_base_T = np.transpose(R_drone_base)
-    #     easting_base, northing_base, h_enu_base = enu.geodetic2enu(lat_base, long_base, h_abs_base, lat0, lon0, h0)
-        
-    #     if distance_is_minimal(easting_base, northing_base, h_enu_base, easting, northing, h_enu):
-    #         image_base_gray = cv2.cvtColor(image_base, cv2.COLOR_BGR2GRAY)
-    #         H = get_homography(image_base_gray, image_gray, orb, bf)
-    #         R_hom = K_inv @ H @ K
-    #         R_alt = R_hom @ droneToCameraR @ R_drone_base_T @ mundoToDroneR
+    yaw = frame_info['gb_yaw'][frame_index]
+    pitch = frame_info['gb_pitch'][frame_index]
+    roll = frame_info['gb_roll'][frame_index]
+    R_drone = poses.R_drone[frame_index]
+
+    h_rel = frame_info['rel_alt'][frame_index]
+    h_abs = frame_info['abs_alt'][frame_index]
+
+    easting, northing, h_enu = poses.t_drone[frame_index]
 
     t_drone_mundo = np.array([[easting], [northing], [h_enu]])
     print_on_pixel(image, f"index:{frame_index}, N:{int(northing)}, E:{int(easting)}, h_rel:{h_rel}, yaw:{yaw}, pitch:{pitch}, roll:{roll}", 10, 10, (0,0,0))
 
-    R = droneToCameraR @ R_drone_T @ mundoToDroneR
+    R = poses.R[frame_index]
+    t = poses.t[frame_index].reshape(3, 1)
+
+    R_alt = None
+    if homography_tracker is not None:
+        R_alt = homography_tracker.update(frame_index, image_gray, R, t_drone_mundo, h_rel)
 
     if get_roi:
         rois = cv2.selectROIs("Select ROIs", image)
@@ -721,23 +397,14 @@ while not glfw.window_should_close(window):
         for i,roi in enumerate(rois):
             x, y, w, h = roi
             image_roi = image[y:y+h, x:x+w]
-            image_roi_gray_list.append(cv2.cvtColor(image_roi, cv2.COLOR_BGR2GRAY))
             roi_data = get_roi_data(i)
-            roi_data_list.append(roi_data)
+            roi_enu = np.array(enu.geodetic2enu(*roi_data, lat0, lon0, h0)).reshape(3, 1)
+            roi_enu_list.append(roi_enu)
+            roi_tracker.add(cv2.cvtColor(image_roi, cv2.COLOR_BGR2GRAY), roi_enu)
         get_roi = False
-    
-    for i,image_roi_gray in enumerate(image_roi_gray_list):
-        if cuda_count == 0:
-            templ_match = cv2.matchTemplate(image_gray, image_roi_gray, cv2.TM_CCOEFF_NORMED)
-        else:
-            gsrc.upload(image_gray)
-            gtemplate.upload(image_roi_gray)
-            gresult = cuda_matcher.match(gsrc, gtemplate)
-            templ_match = gresult.download()
-        min_val, max_val, min_loc, max_loc = cv2.minMaxLoc(templ_match)
-        w, h = image_roi_gray.shape[::-1]
-        roi_x = max_loc[0] + w/2
-        roi_y = max_loc[1] + h/2
+
+    roi_centers, roi_scores = roi_tracker.track(image_gray, project=lambda points: project_points(K, R, t, points))
+    for (roi_x, roi_y), max_val in zip(roi_centers, roi_scores):
         roi_pixel = np.array([[roi_x], [roi_y], [1]])
         roi_pixel_list.append(roi_pixel)
         roi_confidence_list.append(max_val)
@@ -747,99 +414,88 @@ while not glfw.window_should_close(window):
     for i,roi_confidence in enumerate(roi_confidence_list):
         if roi_confidence > roi_minimum_confidence:
             good_roi_list.append(roi_pixel_list[i])
-            lat_roi, long_roi, h_abs_roi = roi_data_list[i]
-            easting_roi, northing_roi, h_enu_roi = enu.geodetic2enu(lat_roi, long_roi, h_abs_roi, lat0, lon0, h0)
-            roi_enu = np.array([[easting_roi],[northing_roi],[h_enu_roi]])
-            good_roi_data_list.append(roi_enu)
+            good_roi_data_list.append(roi_enu_list[i])
     
     if len(good_roi_list) == 1:
         R_roi = get_R_one_roi(good_roi_data_list[0], good_roi_list[0], R, K_inv, t_drone_mundo)
     elif len(good_roi_list) >= 2:
         R_roi = get_R_roi(good_roi_data_list, good_roi_list, K_inv, t_drone_mundo)
     
-    t =  - R @ t_drone_mundo
-
     # Carro
-    pixel_car = K @ np.concatenate((R, t), axis=1) @ np.vstack((t_car_mundo, [1]))
-    pixel_car = pixel_car.flatten()
-    pixel_car = pixel_car / pixel_car[2]
-    instantiate(K, R, t, t_car_mundo, "red", t_drone_mundo, pitch)
-
-    # # Homography stuff
-    # if R_alt is not None:
-    #     pixel_car_alt = K @ np.concatenate((R_alt, - R_alt @ t_drone_mundo), axis=1) @ np.vstack((t_car_mundo, [1]))
-    #     pixel_car_alt = pixel_car_alt.flatten()
-    #     pixel_car_alt = pixel_car_alt / pixel_car_alt[2]
-    #     desenhar_centro(image, int(pixel_car_alt[0] / scale_x), int(pixel_car_alt[1] / scale_y), (255,0,0))
-    #     print_on_pixel(image, f"N:{t_car_mundo[1,0]}, E:{t_car_mundo[0,0]}", int(pixel_car_alt[0] / scale_x), int(pixel_car_alt[1] / scale_y), (255,0,0))
-    #     t_car_opengl_alt = cameraToOpenglR @ R_alt @ (t_car_mundo - t_drone_mundo + [[0],[0],[cone_height]])
-    #     render(lambda: draw_cone_sphere(t_car_opengl_alt[0,0], t_car_opengl_alt[1,0], t_car_opengl_alt[2,0], pitch, "blue"))
+    pixel_car = project(K, R, t, t_car_mundo)[0][0]
+    instantiate(K, R, t, t_car_mundo, "red", t_drone_mundo)
 
+    # Carro com a atitude estimada pela homografia
+    if R_alt is not None:
+        instantiate(K, R_alt, - R_alt @ t_drone_mundo, t_car_mundo, "blue", t_drone_mundo)
+
+    # Posicoes conhecidas dentro do campo de visao
+    if landmarks is not None:
+        landmark_indexes, _ = landmarks.visible(K, R, t, original_width, original_height)
+        instantiate(K, R, t, landmarks.points[landmark_indexes], "yellow", t_drone_mundo)
 
     # Origem coordenada ENU
-    instantiate(K, R, t, np.array([[0],[0],[0]]), "black", t_drone_mundo, pitch)
-
-    for click in clicks:
-        reta = reta3D(K_inv, droneToMundoR @ R_drone @ cameraToDroneR, t_drone_mundo, (click[0], click[1]))
-        # click_ENU = find_ground_intersection_ENU(northing, easting, h_enu, reta[1])
-        vec_DEM = norm_vec(reta[1].flatten())
-        if vec_DEM[2] < 0:
-            vec_DEM = (-1) * vec_DEM
-        if dem_elevation_data is not None:
-            click_ENU = find_DEM_intersection(easting + utm0_x, northing + utm0_y, h_abs - h_dem_offset, vec_DEM)
-        else:
-            click_ENU = find_ground_intersection_ENU(northing, easting, h_enu, vec_DEM)
-        if click_ENU is not None:
-            if dem_elevation_data is not None:
-                click_ENU[0,0] -= utm0_x
-                click_ENU[1,0] -= utm0_y
-                click_ENU[2,0] += h_dem_offset - h0
-            erro_car = np.linalg.norm(click_ENU - t_car_mundo)
-            dist_drone = np.linalg.norm(t_drone_mundo - t_car_mundo)
-            # Frame; Erro; Altura do Drone; Distância do Drone; Click ENU; Click Pixel; Car Pixel; Drone ENU
-            print(f"{frame_index}; {erro_car}; {h_rel}; {dist_drone}; {click_ENU.copy().flatten()}; {(click[0], click[1])}; {(pixel_car[0], pixel_car[1])}; {t_drone_mundo.copy().flatten()}")
+    instantiate(K, R, t, np.array([[0],[0],[0]]), "black", t_drone_mundo)
+
+    # Pre-carregar os blocos do DEM sob a pegada da camera
+    geolocator.prefetch(R, t_drone_mundo.flatten(), h_abs, h_rel, original_width, original_height)
+
+    # Todos os cliques do frame sao geolocalizados de uma vez
+    clicks_ENU_frame = pixel_locator.locate(np.array(clicks, dtype=np.float64).reshape(-1, 2), R, t_drone_mundo.flatten(), h_abs)
+    for click, click_ENU in zip(clicks, clicks_ENU_frame):
+        if not np.isnan(click_ENU).any():
+            click_ENU = click_ENU.reshape(3, 1)
+            print(format_result(frame_index, click_ENU, click, h_rel, t_car_mundo, pixel_car, t_drone_mundo))
             clicks_ENU.append(click_ENU)
 
     clicks.clear()
     clicks_ENU_copy = clicks_ENU.copy()
 
-    for enu_click in clicks_ENU_copy:
-        instantiate(K, R, t, enu_click, "blue", t_drone_mundo, pitch)
-        if R_roi is not None:
-            instantiate(K, R_roi, - R_roi @ t_drone_mundo, enu_click, "green", t_drone_mundo, pitch)
+    clicks_ENU_points = np.array(clicks_ENU_copy).reshape(-1, 3)
+    instantiate(K, R, t, clicks_ENU_points, "blue", t_drone_mundo)
+    if R_roi is not None:
+        instantiate(K, R_roi, - R_roi @ t_drone_mundo, clicks_ENU_points, "green", t_drone_mundo)
     
+    # Deteccoes de carros concluidas, geolocalizadas com a pose e a altitude do frame em que foram capturadas
+    if detection_pipeline is not None:
+        for result_index, predictions in detection_pipeline.results():
+            predictions = [prediction for prediction in predictions if prediction['class_id'] == 0]
+            prediction_pixels = np.array([[prediction['x'], prediction['y']] for prediction in predictions], dtype=np.float64).reshape(-1, 2)
+            # O detector recebe o frame original: centros levados para a imagem sem distorcao
+            if undistorter is not None:
+                prediction_pixels = undistorter.points(prediction_pixels)
+                predictions = [dict(prediction, x=pixel[0], y=pixel[1]) for prediction, pixel in zip(predictions, prediction_pixels)]
+            predictions_ENU = pixel_locator.locate(prediction_pixels, poses.R[result_index], poses.t_drone[result_index],
+                                                frame_info['abs_alt'][result_index])
+            detection_tracker.update(result_index, predictions, predictions_ENU, poses.R[result_index], poses.t[result_index])
+        tracked_predictions, tracked_ENU = detection_tracker.predict(K, R, t, frame_index, original_width, original_height)
+        draw_predictions(image, tracked_predictions, tracked_ENU)
+
+    # Todos os marcadores do frame em uma unica chamada instanciada
+    marker_renderer.draw(cameraToOpenglR @ R, proj_matrix, marker_positions, marker_colors)
+    # Regioes da imagem ocupadas pelos marcadores, usadas na composicao
+    overlay_boxes = marker_boxes(K_render, np.array(marker_positions).reshape(-1, 3) @ cameraToOpenglR.T,
+                                 cone_height + cone_radius, render_width, render_height)
+
+    # Leitura assincrona: recebe a renderizacao (e a imagem) de um frame atras, sem esperar a GPU
+    pixels, rendered_frame = overlay_reader.read((image, overlay_boxes))
     glfw.poll_events()
     glfw.swap_buffers(window)
+    if pixels is None:
+        continue
+    image, overlay_boxes = rendered_frame
+    # A composicao e feita na resolucao da renderizacao
+    if (render_width, render_height) != (original_width, original_height):
+        image = cv2.resize(image, (render_width, render_height))
+    overlay_compositor.composite(pixels, image, overlay_boxes)
     
-    pixels = glReadPixels(0, 0, 1920, 1080, GL_RGB, GL_UNSIGNED_BYTE)
-    image = draw_opengl(pixels, image)
-    
-    # # IA detection stuff
-    # short_image = cv2.resize(image, (int(original_width / scale_reduct_inference), int(original_height / scale_reduct_inference)))
-    # results = client.infer(short_image, model_id=f"{project_id}/{model_version}")
-
-    # for prediction in results['predictions']:
-                        
-    #     width, height = int(prediction['width'] * scale_reduct_inference), int(prediction['height'] * scale_reduct_inference)
-    #     prediction_x = int(prediction['x'] * scale_reduct_inference)
-    #     prediction_y = int(prediction['y'] * scale_reduct_inference)
-
-    #     x, y = int(prediction_x - width/2) , int(prediction_y - height/2)
-        
-    #     class_id = prediction['class_id']
-
-    #     # Calculate the bottom right x and y coordinates
-    #     x2 = int(x + width)
-    #     y2 = int(y + height)
-
-    #     if class_id == 0:
-    #         cv2.rectangle(image, (x, y), (x2, y2), (0, 0, 255), 3)
-    #         desenhar_centro(image, int(prediction_x), int(prediction_y), (0, 0, 255))
-
-    #         reta = reta3D(K_inv, droneToMundoR @ R_drone @ cameraToDroneR, t_drone_mundo, (prediction_x, prediction_y))
-    #         pred_UTM = find_ground_intersection_UTM(northing, easting, h, h_abs, reta[1])
-    #         print_on_pixel(image, f"N:{pred_UTM[1]}, E:{pred_UTM[0]}, ZN:{zone_number}, ZL:{zone_letter}", x, y, (0, 0, 255))
-    
-    rez_img = cv2.resize(image, (resized_width, resized_height))
+    rez_img = image if (render_width, render_height) == (resized_width, resized_height) else cv2.resize(image, (resized_width, resized_height))
     cv2.imshow(window_name, rez_img)
-    cv2.setMouseCallback(window_name, mouse_click, (clicks, clicks_ENU))
\ No newline at end of file
+    cv2.setMouseCallback(window_name, mouse_click, (clicks, clicks_ENU))
+frames.close()
+if detection_pipeline is not None:
+    detection_pipeline.close()
+overlay_reader.close()
+marker_renderer.close()
+if dem_elevation_data is not None:
+    dem_elevation_data.close()
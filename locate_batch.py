@@ -0,0 +1,155 @@
+"""
+Geolocalizacao em lote, sem janela (sem GLFW, Tk ou cv2.imshow).
+
+Le as observacoes de pixels por frame (linhas "frame; x; y") e escreve os resultados
+no mesmo formato de tests/QuintaBoaVista/results/R_from_yaw_pitch_roll.csv.
+
+    python locate_batch.py observacoes.csv -o resultados.csv [-p parameters.json] [--target LAT LON ALT]
+"""
+import argparse
+import json
+import re
+import sys
+import cv2
+import numpy as np
+import pymap3d.enu as enu
+import dem
+from camera import load_camera, load_image_size, Undistorter
+from geolocate import Geolocator, RESULT_HEADER, format_result
+from pose import PoseTable, project, lat0, lon0, h0
+from telemetry import parse_srt
+
+def parse_number(token):
+    value = float(token)
+    return int(value) if value.is_integer() else value
+
+def load_observations(file_path):
+    """
+    Observacoes de pixels, uma por linha: frame; x; y (separados por ';', ',' ou espacos).
+    Linhas vazias, comentarios (#) e cabecalhos nao numericos sao ignorados.
+
+    :return: Lista de (frame, (x, y)) na ordem do arquivo
+    """
+    observations = []
+    with open(file_path, 'r', encoding='utf-8') as file:
+        for line in file:
+            line = line.split('#', 1)[0].strip()
+            if not line:
+                continue
+            tokens = [token for token in re.split(r'[;,\s]+', line) if token]
+            try:
+                frame = int(tokens[0])
+                pixel = (parse_number(tokens[1]), parse_number(tokens[2]))
+            except (ValueError, IndexError):
+                continue
+            observations.append((frame, pixel))
+    return observations
+
+def load_dem(parameters):
+    try:
+        return dem.TiledDEM(parameters["tif_path"], cache_mb=parameters.get("dem_cache_mb", 256))
+    except Exception as e:
+        print(f"Error: {e}\nConsidering flat terrain...", file=sys.stderr)
+        return None
+
+def load_frame_size(parameters):
+    """
+    Tamanho (largura, altura) dos frames do video: lido do video (video_path), se ele abrir, ou do
+    arquivo da camera; senao 1920x1080, o tamanho usado por locate-obj.
+    """
+    if "video_path" in parameters:
+        cap = cv2.VideoCapture(parameters["video_path"])
+        try:
+            if cap.isOpened():
+                return int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        finally:
+            cap.release()
+    return load_image_size(parameters["K_path"]) or (1920, 1080)
+
+def target_enu(target):
+    """ Posicao conhecida (lat, lon, alt) em ENU; NaN se nao houver. """
+    if target is None:
+        return np.full(3, np.nan)
+    return np.array(enu.geodetic2enu(*target, lat0, lon0, h0))
+
+def geolocate_observations(geolocator, frame_info, poses, observations, t_target, undistorter=None, frame_size=None):
+    """
+    Geolocaliza todas as observacoes de uma vez. Com frame_size (largura, altura), os blocos do DEM
+    sob a pegada de cada frame sao carregados antes. Com undistorter, os pixels (do video original)
+    sao corrigidos da distorcao da lente em lote antes da geolocalizacao. Observacoes de frames
+    fora da telemetria sao ignoradas, com um aviso na saida de erro.
+
+    :return: Lista de linhas no formato de RESULT_HEADER, em ordem de frame
+    """
+    valid = []
+    for frame_index, pixel in observations:
+        if 0 <= frame_index < len(poses):
+            valid.append((frame_index, pixel))
+        else:
+            print(f"Frame {frame_index} fora da telemetria (0 a {len(poses) - 1}), observacao {pixel} ignorada", file=sys.stderr)
+    observations = valid
+    if len(observations) == 0:
+        return []
+    order = sorted(range(len(observations)), key=lambda i: observations[i][0])
+    frame_indexes = np.array([observations[i][0] for i in order])
+    pixels = np.array([observations[i][1] for i in order], dtype=np.float64)
+    if undistorter is not None:
+        pixels = undistorter.points(pixels)
+
+    if geolocator.dem_pyramid is not None and frame_size is not None:
+        for frame_index in np.unique(frame_indexes):
+            geolocator.prefetch(poses.R[frame_index], poses.t_drone[frame_index], frame_info['abs_alt'][frame_index],
+                                frame_info['rel_alt'][frame_index], *frame_size)
+    points = geolocator.locate(pixels, poses.R[frame_indexes], poses.t_drone[frame_indexes], frame_info['abs_alt'][frame_indexes])
+
+    # Posicao conhecida projetada com a pose de cada observacao (lote de poses)
+    target_pixels = project(geolocator.K, poses.R[frame_indexes], poses.t[frame_indexes], t_target)[0][:, 0]
+
+    lines = []
+    for i, frame_index in enumerate(frame_indexes):
+        if np.isnan(points[i]).any():
+            continue
+        lines.append(format_result(frame_index, points[i], observations[order[i]][1], frame_info['rel_alt'][frame_index],
+                                   t_target, target_pixels[i], poses.t_drone[frame_index]))
+    return lines
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Geolocalizacao em lote de pixels observados no video do drone.")
+    parser.add_argument("observations", help="Arquivo com linhas 'frame; x; y'")
+    parser.add_argument("-p", "--parameters", default="parameters.json", help="Arquivo de parametros (K_path, tif_path, video_data_path)")
+    parser.add_argument("-o", "--output", help="Arquivo de saida (padrao: saida padrao)")
+    parser.add_argument("--video-data", help="Arquivo .SRT do voo (padrao: video_data_path dos parametros)")
+    parser.add_argument("--target", nargs=3, type=float, metavar=("LAT", "LON", "ALT"),
+                        help="Posicao conhecida para a coluna de erro (padrao: 'target' dos parametros)")
+    args = parser.parse_args(argv)
+
+    with open(args.parameters, "r") as json_file:
+        parameters = json.load(json_file)
+    K, dist_coeffs = load_camera(parameters["K_path"])
+    undistorter = None if dist_coeffs is None else Undistorter(K, dist_coeffs)
+
+    t_target = target_enu(args.target or parameters.get("target"))
+
+    frame_info = parse_srt(args.video_data or parameters["video_data_path"])
+    poses = PoseTable(frame_info, lat0, lon0, h0)
+    dem_pyramid = load_dem(parameters)
+    geolocator = Geolocator(K, lat0, lon0, h0, dem_pyramid=dem_pyramid)
+
+    try:
+        lines = geolocate_observations(geolocator, frame_info, poses, load_observations(args.observations), t_target, undistorter,
+                                       load_frame_size(parameters))
+    finally:
+        if dem_pyramid is not None:
+            dem_pyramid.close()
+
+    output = open(args.output, "w") if args.output else sys.stdout
+    try:
+        output.write(RESULT_HEADER + "\n")
+        for line in lines:
+            output.write(line + "\n")
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+if __name__ == "__main__":
+    main()
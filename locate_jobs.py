@@ -0,0 +1,123 @@
+"""
+Geolocalizacao em lote de varios voos em paralelo (pool de processos).
+
+O DEM e as tabelas de pose sao calculados uma unica vez no processo principal e gravados
+como .npy; os processos apenas os mapeiam em memoria (np.load com mmap_mode), sem reler o GeoTIFF.
+Cada voo e dividido em faixas de frames e os resultados sao juntados em ordem de frame.
+
+    python locate_jobs.py -p parameters.json -j 8 --job obs1.csv voo1.SRT res1.csv --job obs2.csv voo2.SRT res2.csv
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import dem
+from camera import load_camera, Undistorter
+from geolocate import Geolocator, RESULT_HEADER
+from locate_batch import load_observations, load_frame_size, geolocate_observations, target_enu
+from pose import PoseTable, lat0, lon0, h0
+from telemetry import parse_srt
+
+worker_geolocator = None
+worker_undistorter = None
+worker_frame_size = None
+
+def save_shared_arrays(directory, name, arrays):
+    paths = {}
+    for key, array in arrays.items():
+        paths[key] = os.path.join(directory, f"{name}_{key}.npy")
+        np.save(paths[key], array)
+    return paths
+
+def load_shared_arrays(paths):
+    return {key: np.load(path, mmap_mode='r') for key, path in paths.items()}
+
+def init_worker(K, dist_coeffs, dem_paths, dem_shape, dem_transform, frame_size=None):
+    # Uma vez por processo: mapear a piramide do DEM e montar o geolocalizador
+    global worker_geolocator, worker_undistorter, worker_frame_size
+    worker_frame_size = frame_size
+    dem_pyramid = None
+    if dem_paths is not None:
+        arrays = load_shared_arrays(dem_paths)
+        dem_pyramid = dem.DEMPyramid.from_arrays(arrays['heights'], arrays['offsets'], arrays['widths'], dem_shape, dem_transform)
+    worker_geolocator = Geolocator(K, lat0, lon0, h0, dem_pyramid=dem_pyramid)
+    worker_undistorter = None if dist_coeffs is None else Undistorter(K, dist_coeffs)
+
+def run_chunk(flight_paths, observations, t_target):
+    arrays = load_shared_arrays(flight_paths)
+    poses = PoseTable.from_arrays(arrays)
+    return geolocate_observations(worker_geolocator, arrays, poses, observations, t_target, worker_undistorter, worker_frame_size)
+
+def split_frame_ranges(observations, chunk_count):
+    """ Divide as observacoes (ordenadas por frame) em ate chunk_count faixas contiguas de frames. """
+    observations = sorted(observations, key=lambda observation: observation[0])
+    size = max(1, -(-len(observations) // max(1, chunk_count)))
+    chunks = []
+    start = 0
+    while start < len(observations):
+        end = min(start + size, len(observations))
+        # Nao dividir um mesmo frame entre duas faixas
+        while end < len(observations) and observations[end][0] == observations[end - 1][0]:
+            end += 1
+        chunks.append(observations[start:end])
+        start = end
+    return chunks
+
+def run_jobs(parameters, K, jobs, t_target, workers=None, chunks_per_worker=4, dist_coeffs=None):
+    """
+    :param jobs: Lista de (arquivo de observacoes, arquivo .SRT, arquivo de saida)
+    """
+    workers = workers or os.cpu_count()
+    with tempfile.TemporaryDirectory(prefix="locate-jobs-") as shared_dir:
+        dem_paths, dem_shape, dem_transform = None, None, None
+        try:
+            # Piramide gravada direto em disco, por faixas e no tipo do GeoTIFF; nenhum processo carrega o raster inteiro
+            dem_paths, dem_shape, dem_transform = dem.write_pyramid_arrays(parameters["tif_path"], shared_dir)
+        except Exception as e:
+            print(f"Error: {e}\nConsidering flat terrain...", file=sys.stderr)
+
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                                 initargs=(K, dist_coeffs, dem_paths, dem_shape, dem_transform,
+                                           load_frame_size(parameters))) as executor:
+            futures = []
+            for job_index, (observations_path, srt_path, output_path) in enumerate(jobs):
+                frame_info = parse_srt(srt_path)
+                poses = PoseTable(frame_info, lat0, lon0, h0)
+                flight_paths = save_shared_arrays(shared_dir, f"flight{job_index}", {
+                    'R_drone': poses.R_drone, 't_drone': poses.t_drone, 'R': poses.R, 't': poses.t,
+                    'abs_alt': frame_info['abs_alt'], 'rel_alt': frame_info['rel_alt']})
+
+                chunks = split_frame_ranges(load_observations(observations_path), workers * chunks_per_worker)
+                futures.append((output_path, [executor.submit(run_chunk, flight_paths, chunk, t_target) for chunk in chunks]))
+
+            # As faixas de cada voo foram enviadas em ordem de frame
+            for output_path, chunk_futures in futures:
+                with open(output_path, "w") as output:
+                    output.write(RESULT_HEADER + "\n")
+                    for future in chunk_futures:
+                        for line in future.result():
+                            output.write(line + "\n")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Geolocalizacao em lote de varios voos com um pool de processos.")
+    parser.add_argument("--job", nargs=3, action="append", required=True, metavar=("OBSERVATIONS", "SRT", "OUTPUT"),
+                        help="Observacoes 'frame; x; y', telemetria .SRT e arquivo de saida de um voo")
+    parser.add_argument("-p", "--parameters", default="parameters.json", help="Arquivo de parametros (K_path, tif_path)")
+    parser.add_argument("-j", "--workers", type=int, help="Numero de processos (padrao: numero de CPUs)")
+    parser.add_argument("--target", nargs=3, type=float, metavar=("LAT", "LON", "ALT"),
+                        help="Posicao conhecida para a coluna de erro (padrao: 'target' dos parametros)")
+    args = parser.parse_args(argv)
+
+    with open(args.parameters, "r") as json_file:
+        parameters = json.load(json_file)
+    K, dist_coeffs = load_camera(parameters["K_path"])
+
+    t_target = target_enu(args.target or parameters.get("target"))
+
+    run_jobs(parameters, K, args.job, t_target, workers=args.workers, dist_coeffs=dist_coeffs)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,426 @@
+import ctypes
+from collections import deque
+import cv2
+import numpy as np
+from OpenGL.GL import *
+
+class PBOReader:
+    """
+    Leitura assincrona do framebuffer do OpenGL com count pixel buffer objects em anel.
+
+    read() inicia a copia do frame atual para um PBO (sem esperar a GPU) e devolve o frame
+    iniciado count - 1 chamadas antes, ja pronto, junto com o objeto associado a ele (ex.: a
+    imagem do video). Com channels=4 os pixels vem em BGRA, na ordem de canais do OpenCV.
+    O array devolvido e uma view sem copia do PBO mapeado, valida ate a
+    proxima chamada de read().
+    """
+    def __init__(self, width, height, channels=3, count=2):
+        self.width = width
+        self.height = height
+        self.channels = channels
+        self.format = GL_RGB if channels == 3 else GL_BGRA
+        self.size = width * height * channels
+        self.count = count
+        self.pbos = np.atleast_1d(glGenBuffers(count))
+        for pbo in self.pbos:
+            glBindBuffer(GL_PIXEL_PACK_BUFFER, pbo)
+            glBufferData(GL_PIXEL_PACK_BUFFER, self.size, None, GL_STREAM_READ)
+        glBindBuffer(GL_PIXEL_PACK_BUFFER, 0)
+        self.index = 0
+        self.pending = deque()
+        self.mapped = None
+
+    def _unmap(self):
+        if self.mapped is not None:
+            glBindBuffer(GL_PIXEL_PACK_BUFFER, self.mapped)
+            glUnmapBuffer(GL_PIXEL_PACK_BUFFER)
+            glBindBuffer(GL_PIXEL_PACK_BUFFER, 0)
+            self.mapped = None
+
+    def read(self, payload=None):
+        """
+        :return: (pixels, payload) do frame mais antigo pronto, ou (None, None) enquanto o anel enche
+        """
+        self._unmap()
+        glPixelStorei(GL_PACK_ALIGNMENT, 1)
+
+        # Iniciar a copia do frame atual; glReadPixels com PBO retorna sem esperar a GPU
+        pbo = self.pbos[self.index]
+        glBindBuffer(GL_PIXEL_PACK_BUFFER, pbo)
+        glReadPixels(0, 0, self.width, self.height, self.format, GL_UNSIGNED_BYTE, ctypes.c_void_p(0))
+        self.pending.append((pbo, payload))
+        self.index = (self.index + 1) % self.count
+
+        if len(self.pending) < self.count:
+            glBindBuffer(GL_PIXEL_PACK_BUFFER, 0)
+            return None, None
+
+        pbo, payload = self.pending.popleft()
+        glBindBuffer(GL_PIXEL_PACK_BUFFER, pbo)
+        address = glMapBuffer(GL_PIXEL_PACK_BUFFER, GL_READ_ONLY)
+        self.mapped = pbo
+        glBindBuffer(GL_PIXEL_PACK_BUFFER, 0)
+        buffer = ctypes.cast(address, ctypes.POINTER(ctypes.c_ubyte * self.size)).contents
+        pixels = np.frombuffer(buffer, dtype=np.uint8).reshape(self.height, self.width, self.channels)
+        return pixels, payload
+
+    def close(self):
+        self._unmap()
+        glDeleteBuffers(self.count, self.pbos)
+
+MARKER_VERTEX_SHADER = """
+#version 330
+layout(location = 0) in vec3 vertex_position;
+layout(location = 1) in vec3 vertex_normal;
+layout(location = 2) in vec3 marker_position;
+layout(location = 3) in vec4 marker_color;
+uniform mat3 rotation;
+uniform mat4 projection;
+out vec3 eye_position;
+out vec3 eye_normal;
+out vec4 color;
+void main() {
+    eye_position = rotation * vertex_position + marker_position;
+    eye_normal = rotation * vertex_normal;
+    color = marker_color;
+    gl_Position = projection * vec4(eye_position, 1.0);
+}
+"""
+
+MARKER_FRAGMENT_SHADER = """
+#version 330
+in vec3 eye_position;
+in vec3 eye_normal;
+in vec4 color;
+uniform vec3 light_position;
+uniform vec3 light_ambient;
+uniform vec3 light_diffuse;
+uniform vec3 light_specular;
+uniform float shininess;
+out vec4 frag_color;
+void main() {
+    vec3 n = normalize(eye_normal);
+    if (!gl_FrontFacing) n = -n;
+    vec3 l = normalize(light_position - eye_position);
+    vec3 h = normalize(l - normalize(eye_position));
+    float diffuse = max(dot(n, l), 0.0);
+    float specular = diffuse > 0.0 ? pow(max(dot(n, h), 0.0), shininess) : 0.0;
+    frag_color = vec4(color.rgb * (light_ambient + light_diffuse * diffuse) + light_specular * specular, color.a);
+}
+"""
+
+def compile_program(vertex_source, fragment_source):
+    program = glCreateProgram()
+    shaders = []
+    for shader_type, source in ((GL_VERTEX_SHADER, vertex_source), (GL_FRAGMENT_SHADER, fragment_source)):
+        shader = glCreateShader(shader_type)
+        glShaderSource(shader, source)
+        glCompileShader(shader)
+        if not glGetShaderiv(shader, GL_COMPILE_STATUS):
+            raise RuntimeError(f"Erro ao compilar o shader: {glGetShaderInfoLog(shader)}")
+        glAttachShader(program, shader)
+        shaders.append(shader)
+    glLinkProgram(program)
+    if not glGetProgramiv(program, GL_LINK_STATUS):
+        raise RuntimeError(f"Erro ao ligar o programa: {glGetProgramInfoLog(program)}")
+    for shader in shaders:
+        glDeleteShader(shader)
+    return program
+
+def marker_mesh(radius, height, slices=20, stacks=20):
+    """
+    Triangulos (posicao, normal) do marcador em coordenadas ENU relativas ao centro da esfera:
+    esfera de raio radius e cone de base radius com a ponta height abaixo do centro (no ponto marcado).
+
+    :return: Array float32 (V,6)
+    """
+    theta = np.linspace(0, 2 * np.pi, slices + 1)
+    phi = np.linspace(0, np.pi, stacks + 1)
+
+    # Esfera: grade (stacks+1, slices+1) de normais unitarias
+    normals = np.stack(np.broadcast_arrays(np.sin(phi)[:, None] * np.cos(theta)[None, :],
+                                           np.sin(phi)[:, None] * np.sin(theta)[None, :],
+                                           np.cos(phi)[:, None]), axis=-1)
+    quads = np.stack((normals[:-1, :-1], normals[1:, :-1], normals[1:, 1:], normals[:-1, 1:]), axis=2).reshape(-1, 4, 3)
+    sphere_normals = quads[:, [0, 1, 2, 0, 2, 3]].reshape(-1, 3)
+    sphere = np.concatenate((radius * sphere_normals, sphere_normals), axis=1)
+
+    # Cone: base no centro da esfera, ponta em (0, 0, -height)
+    slope = radius / height
+    ring = np.stack((np.cos(theta), np.sin(theta), np.zeros_like(theta)), axis=1)
+    ring_normals = ring + [0, 0, -slope]
+    ring_normals /= np.linalg.norm(ring_normals, axis=1, keepdims=True)
+    apex = np.array([0, 0, -height])
+    cone = []
+    for i in range(slices):
+        apex_normal = ring_normals[i] + ring_normals[i + 1]
+        apex_normal /= np.linalg.norm(apex_normal)
+        cone += [(radius * ring[i], ring_normals[i]), (apex, apex_normal), (radius * ring[i + 1], ring_normals[i + 1])]
+    cone = np.array([np.concatenate(vertex) for vertex in cone])
+
+    return np.concatenate((sphere, cone)).astype(np.float32)
+
+class MarkerRenderer:
+    """
+    Desenho de todos os marcadores (esfera + cone) do frame em uma unica chamada instanciada.
+
+    A malha e enviada uma vez para a GPU; por frame so o array de posicoes e cores e atualizado.
+    A iluminacao reproduz a do pipeline fixo anterior (luz pontual em coordenadas da camera).
+    """
+    def __init__(self, radius, height, slices=20, stacks=20, light_position=(0, 3, 3), light_ambient=(0.2, 0.2, 0.2),
+                 light_diffuse=(0.8, 0.8, 0.8), light_specular=(1.0, 1.0, 1.0), shininess=50.0):
+        self.program = compile_program(MARKER_VERTEX_SHADER, MARKER_FRAGMENT_SHADER)
+        self.uniforms = {name: glGetUniformLocation(self.program, name) for name in
+                         ("rotation", "projection", "light_position", "light_ambient", "light_diffuse", "light_specular", "shininess")}
+        glUseProgram(self.program)
+        glUniform3f(self.uniforms["light_position"], *light_position)
+        glUniform3f(self.uniforms["light_ambient"], *light_ambient)
+        glUniform3f(self.uniforms["light_diffuse"], *light_diffuse)
+        glUniform3f(self.uniforms["light_specular"], *light_specular)
+        glUniform1f(self.uniforms["shininess"], shininess)
+        glUseProgram(0)
+
+        mesh = marker_mesh(radius, height, slices, stacks)
+        self.vertex_count = mesh.shape[0]
+        self.vao = glGenVertexArrays(1)
+        self.mesh_vbo, self.instance_vbo = glGenBuffers(2)
+        glBindVertexArray(self.vao)
+
+        glBindBuffer(GL_ARRAY_BUFFER, self.mesh_vbo)
+        glBufferData(GL_ARRAY_BUFFER, mesh.nbytes, mesh, GL_STATIC_DRAW)
+        for location, offset in ((0, 0), (1, 12)):
+            glEnableVertexAttribArray(location)
+            glVertexAttribPointer(location, 3, GL_FLOAT, GL_FALSE, 24, ctypes.c_void_p(offset))
+
+        # Atributos por instancia: posicao (3) e cor (4)
+        glBindBuffer(GL_ARRAY_BUFFER, self.instance_vbo)
+        for location, size, offset in ((2, 3, 0), (3, 4, 12)):
+            glEnableVertexAttribArray(location)
+            glVertexAttribPointer(location, size, GL_FLOAT, GL_FALSE, 28, ctypes.c_void_p(offset))
+            glVertexAttribDivisor(location, 1)
+
+        glBindVertexArray(0)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+
+    def draw(self, rotation, projection, positions, colors):
+        """
+        :param rotation: Rotacao 3x3 mundo (ENU) -> camera do OpenGL, que orienta a malha
+        :param projection: Matriz de projecao 4x4
+        :param positions: Centros das esferas em coordenadas da camera do OpenGL (N,3)
+        :param colors: Cores RGBA (N,4) em [0, 1]
+        """
+        positions = np.asarray(positions, dtype=np.float32).reshape(-1, 3)
+        if positions.shape[0] == 0:
+            return
+        instances = np.ascontiguousarray(np.concatenate((positions, np.asarray(colors, dtype=np.float32).reshape(-1, 4)), axis=1))
+
+        glUseProgram(self.program)
+        glUniformMatrix3fv(self.uniforms["rotation"], 1, GL_TRUE, np.asarray(rotation, dtype=np.float32))
+        glUniformMatrix4fv(self.uniforms["projection"], 1, GL_TRUE, np.asarray(projection, dtype=np.float32))
+        glBindVertexArray(self.vao)
+        glBindBuffer(GL_ARRAY_BUFFER, self.instance_vbo)
+        glBufferData(GL_ARRAY_BUFFER, instances.nbytes, instances, GL_STREAM_DRAW)
+        glDrawArraysInstanced(GL_TRIANGLES, 0, self.vertex_count, instances.shape[0])
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+        glBindVertexArray(0)
+        glUseProgram(0)
+
+    def close(self):
+        glDeleteBuffers(2, [self.mesh_vbo, self.instance_vbo])
+        glDeleteVertexArrays(1, [self.vao])
+        glDeleteProgram(self.program)
+
+class FixedFunctionMarkerRenderer:
+    """
+    Mesma interface de MarkerRenderer com o pipeline fixo do OpenGL (contextos legados, sem GLSL 330):
+    a malha fica em arrays do cliente e cada marcador e uma chamada glDrawArrays.
+    """
+    def __init__(self, radius, height, slices=20, stacks=20, light_position=(0, 3, 3), light_ambient=(0.2, 0.2, 0.2),
+                 light_diffuse=(0.8, 0.8, 0.8), light_specular=(1.0, 1.0, 1.0), shininess=50.0):
+        mesh = marker_mesh(radius, height, slices, stacks)
+        self.vertices = np.ascontiguousarray(mesh[:, :3])
+        self.normals = np.ascontiguousarray(mesh[:, 3:])
+        self.shininess = shininess
+
+        # Luz pontual em coordenadas da camera (posicao definida com a modelview identidade)
+        glMatrixMode(GL_MODELVIEW)
+        glLoadIdentity()
+        glLightfv(GL_LIGHT0, GL_POSITION, [*light_position, 1.0])
+        glLightfv(GL_LIGHT0, GL_AMBIENT, [*light_ambient, 1.0])
+        glLightfv(GL_LIGHT0, GL_DIFFUSE, [*light_diffuse, 1.0])
+        glLightfv(GL_LIGHT0, GL_SPECULAR, [*light_specular, 1.0])
+        # Como no shader, as faces de tras usam a normal invertida
+        glLightModeli(GL_LIGHT_MODEL_TWO_SIDE, GL_TRUE)
+        glEnable(GL_NORMALIZE)
+
+    def draw(self, rotation, projection, positions, colors):
+        """ Mesmos parametros de MarkerRenderer.draw. """
+        positions = np.asarray(positions, dtype=np.float64).reshape(-1, 3)
+        if positions.shape[0] == 0:
+            return
+        colors = np.asarray(colors, dtype=np.float32).reshape(-1, 4)
+
+        glMatrixMode(GL_PROJECTION)
+        glLoadMatrixf(np.asarray(projection, dtype=np.float32).T)
+        glMatrixMode(GL_MODELVIEW)
+        glEnable(GL_LIGHTING)
+        glEnable(GL_LIGHT0)
+        glEnableClientState(GL_VERTEX_ARRAY)
+        glEnableClientState(GL_NORMAL_ARRAY)
+        glVertexPointer(3, GL_FLOAT, 0, self.vertices)
+        glNormalPointer(GL_FLOAT, 0, self.normals)
+        glMaterialfv(GL_FRONT_AND_BACK, GL_SPECULAR, [1.0, 1.0, 1.0, 1.0])
+        glMaterialf(GL_FRONT_AND_BACK, GL_SHININESS, self.shininess)
+
+        modelview = np.eye(4, dtype=np.float32)
+        modelview[:3, :3] = rotation
+        for position, color in zip(positions, colors):
+            modelview[:3, 3] = position
+            glLoadMatrixf(modelview.T)
+            glMaterialfv(GL_FRONT_AND_BACK, GL_AMBIENT, color)
+            glMaterialfv(GL_FRONT_AND_BACK, GL_DIFFUSE, color)
+            glDrawArrays(GL_TRIANGLES, 0, self.vertices.shape[0])
+
+        glDisableClientState(GL_NORMAL_ARRAY)
+        glDisableClientState(GL_VERTEX_ARRAY)
+        glDisable(GL_LIGHTING)
+
+    def close(self):
+        pass
+
+def create_marker_renderer(radius, height, **kwargs):
+    """
+    MarkerRenderer (GLSL 330, desenho instanciado) se o contexto suportar; senao o pipeline fixo.
+    """
+    try:
+        return MarkerRenderer(radius, height, **kwargs)
+    except Exception as e:
+        print(f"Shaders dos marcadores indisponiveis ({e}), usando o pipeline fixo do OpenGL")
+        return FixedFunctionMarkerRenderer(radius, height, **kwargs)
+
+def scale_intrinsics(K, scale):
+    """
+    Matriz de intrinsecos para renderizar a imagem reduzida por scale (mantendo os centros dos pixels alinhados).
+    """
+    K_scaled = np.array(K, dtype=np.float64)
+    K_scaled[:2, :2] *= scale
+    K_scaled[:2, 2] = (K_scaled[:2, 2] + 0.5) * scale - 0.5
+    return K_scaled
+
+def marker_boxes(K, centers_camera, extent, width, height, margin=2):
+    """
+    Retangulos (x0, y0, x1, y1) da imagem que contem cada marcador 3D: projecao da caixa de meia
+    aresta extent em torno de cada centro (N,3) em coordenadas da camera. Se a caixa cruzar o plano
+    da camera, usa a imagem toda; se estiver toda atras da camera, o retangulo e vazio.
+
+    :return: Array de inteiros (N,4)
+    """
+    offsets = extent * np.array([[dx, dy, dz] for dx in (-1, 1) for dy in (-1, 1) for dz in (-1, 1)])
+    corners_camera = np.asarray(centers_camera, dtype=np.float64).reshape(-1, 1, 3) + offsets
+    behind = np.any(corners_camera[:, :, 2] <= 0, axis=1)
+    hidden = np.all(corners_camera[:, :, 2] <= 0, axis=1)
+    corners_camera[:, :, 2] = np.maximum(corners_camera[:, :, 2], 1e-9)
+    pixels = corners_camera @ K.T
+    pixels = pixels[:, :, :2] / pixels[:, :, 2:]
+    boxes = np.concatenate((np.floor(pixels.min(axis=1)) - margin, np.ceil(pixels.max(axis=1)) + margin), axis=1)
+    boxes[behind] = (0, 0, width, height)
+    boxes[hidden] = 0
+    boxes = np.clip(boxes, 0, [width, height, width, height])
+    return boxes.astype(int)
+
+def box_area(box):
+    return max(box[2] - box[0], 0) * max(box[3] - box[1], 0)
+
+def overlap(a, b):
+    return a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]
+
+def subtract_box(box, other):
+    """ Partes (ate 4 retangulos) de box fora de other. """
+    x0, y0, x1, y1 = box
+    ox0, oy0, ox1, oy1 = max(other[0], x0), max(other[1], y0), min(other[2], x1), min(other[3], y1)
+    pieces = [[x0, y0, x1, oy0], [x0, oy1, x1, y1], [x0, oy0, ox0, oy1], [ox1, oy0, x1, oy1]]
+    return [piece for piece in pieces if box_area(piece) > 0]
+
+def merge_boxes(boxes, max_empty=0.5):
+    """
+    Retangulos (x0, y0, x1, y1) disjuntos cobrindo os dados: dois retangulos sobrepostos sao unidos no
+    retangulo que contem os dois se no maximo max_empty dele ficar descoberto; senao a sobreposicao
+    e recortada de um deles. Retangulos vazios sao descartados.
+
+    :return: Array de inteiros (M,4)
+    """
+    merged = [list(box) for box in np.asarray(boxes, dtype=int).reshape(-1, 4) if box[2] > box[0] and box[3] > box[1]]
+    changed = True
+    while changed:
+        changed = False
+        for i in range(len(merged)):
+            j = i + 1
+            while j < len(merged):
+                a, b = merged[i], merged[j]
+                union = [min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3])]
+                intersection = [max(a[0], b[0]), max(a[1], b[1]), min(a[2], b[2]), min(a[3], b[3])]
+                covered = box_area(a) + box_area(b) - box_area(intersection)
+                if overlap(a, b) and covered >= (1 - max_empty) * box_area(union):
+                    merged[i] = union
+                    del merged[j]
+                    changed = True
+                else:
+                    j += 1
+
+    # Sobreposicoes que sobraram: cada retangulo perde a parte ja coberta pelos anteriores
+    disjoint = []
+    for box in merged:
+        pieces = [box]
+        for other in disjoint:
+            pieces = [piece for part in pieces for piece in (subtract_box(part, other) if overlap(part, other) else [part])]
+        disjoint.extend(pieces)
+    return np.array(disjoint, dtype=int).reshape(-1, 4)
+
+class OverlayCompositor:
+    """
+    Composicao alfa, in-place na imagem, da renderizacao BGRA (ja na orientacao da imagem), somente
+    dentro dos retangulos dos marcadores desenhados. Retangulos sobrepostos sao unidos ou recortados
+    antes, para que nenhum pixel seja composto duas vezes.
+
+    O resultado e igual a (cor * alfa + imagem * (255 - alfa) + 127) // 255, calculado com operacoes do
+    cv2 em 16 bits (a soma cabe em 16 bits e o arredondamento de / 255 e o mesmo). Os buffers
+    intermediarios sao reaproveitados entre os frames.
+    """
+    def __init__(self):
+        self.buffers = {}
+
+    def _buffer(self, name, shape, dtype):
+        size = int(np.prod(shape))
+        buffer = self.buffers.get(name)
+        if buffer is None or buffer.size < size:
+            buffer = self.buffers[name] = np.empty(size, dtype=dtype)
+        return buffer[:size].reshape(shape)
+
+    def composite(self, rendered_bgra, image, boxes):
+        boxes = merge_boxes(boxes)
+        # Com muitos marcadores e mais barato compor a imagem inteira uma vez
+        area = np.sum((boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1]))
+        if area >= image.shape[0] * image.shape[1]:
+            boxes = [(0, 0, image.shape[1], image.shape[0])]
+        for x0, y0, x1, y1 in boxes:
+            source = rendered_bgra[y0:y1, x0:x1]
+            target = image[y0:y1, x0:x1]
+            shape = (y1 - y0, x1 - x0, 3)
+            alpha8 = cv2.cvtColor(source[:, :, 3], cv2.COLOR_GRAY2BGR, dst=self._buffer('alpha8', shape, np.uint8))
+            color8 = cv2.cvtColor(source, cv2.COLOR_BGRA2BGR, dst=self._buffer('color8', shape, np.uint8))
+            alpha = self._buffer('alpha', shape, np.uint16)
+            color = self._buffer('color', shape, np.uint16)
+            background = self._buffer('background', shape, np.uint16)
+            np.copyto(alpha, alpha8)
+            np.copyto(color, color8)
+            np.copyto(background, target)
+            cv2.multiply(color, alpha, dst=color)
+            np.subtract(255, alpha, out=alpha)
+            cv2.multiply(background, alpha, dst=background)
+            cv2.add(color, background, dst=color)
+            target[:] = cv2.convertScaleAbs(color, dst=self._buffer('result', shape, np.uint8), alpha=1 / 255)
+        return image
+
+def composite_overlay(rendered_bgra, image, boxes):
+    """ OverlayCompositor.composite sem reaproveitar os buffers entre chamadas. """
+    return OverlayCompositor().composite(rendered_bgra, image, boxes)
@@ -0,0 +1,86 @@
+import numpy as np
+import pymap3d.enu as enu
+
+# Origem do sistema ENU
+lat0 = -22.905812
+lon0 = -43.221329
+h0 = 12.456
+
+droneToMundoR = np.array([[0,1,0],[1,0,0],[0,0,-1]])
+mundoToDroneR = np.transpose(droneToMundoR)
+cameraToDroneR = np.array([[0,0,1],[1,0,0],[0,1,0]])
+droneToCameraR = np.transpose(cameraToDroneR)
+cameraToMundoR = np.array([[1,0,0],[0,0,1],[0,-1,0]])
+mundoToCameraR = np.transpose(cameraToMundoR)
+cameraToOpenglR = np.array([[1,0,0],[0,-1,0],[0,0,-1]])
+
+def yaw_pitch_roll_to_rotation_matrix(yaw, pitch, roll):
+    # Aceita escalares ou arrays de angulos; retorna (..., 3, 3)
+    # Converter ângulos de graus para radianos
+    yaw = np.radians(yaw)
+    pitch = np.radians(pitch)
+    roll = np.radians(roll)
+
+    cy, sy = np.cos(yaw), np.sin(yaw)
+    cp, sp = np.cos(pitch), np.sin(pitch)
+    cr, sr = np.cos(roll), np.sin(roll)
+
+    # Matriz de rotação composta: R = Rz * Ry * Rx
+    R = np.stack([
+        np.stack([cy * cp, cy * sp * sr - sy * cr, cy * sp * cr + sy * sr], axis=-1),
+        np.stack([sy * cp, sy * sp * sr + cy * cr, sy * sp * cr - cy * sr], axis=-1),
+        np.stack([-sp,     cp * sr,                cp * cr], axis=-1),
+    ], axis=-2)
+    return R
+
+class PoseTable:
+    """
+    Poses da camera de todos os frames do voo, calculadas de uma vez a partir da telemetria.
+
+    R_drone (F,3,3): atitude do gimbal; t_drone (F,3): posicao do drone em ENU;
+    R (F,3,3) e t (F,3): pose mundo -> camera (x_camera = R x_mundo + t).
+    """
+    def __init__(self, frame_info, lat0, lon0, h0):
+        self.R_drone = yaw_pitch_roll_to_rotation_matrix(frame_info['gb_yaw'], frame_info['gb_pitch'], frame_info['gb_roll'])
+        easting, northing, h_enu = enu.geodetic2enu(frame_info['latitude'], frame_info['longitude'], frame_info['abs_alt'], lat0, lon0, h0)
+        self.t_drone = np.stack((easting, northing, h_enu), axis=1)
+        self.R = droneToCameraR @ np.swapaxes(self.R_drone, 1, 2) @ mundoToDroneR
+        self.t = -np.einsum('fij,fj->fi', self.R, self.t_drone)
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        """ Tabela a partir de arrays ja calculados (ex.: mapeados em memoria compartilhada). """
+        poses = cls.__new__(cls)
+        poses.R_drone, poses.t_drone, poses.R, poses.t = arrays['R_drone'], arrays['t_drone'], arrays['R'], arrays['t']
+        return poses
+
+    def __len__(self):
+        return self.t.shape[0]
+
+def project(K, R, t, points, width=None, height=None, near=0.0):
+    """
+    Projeta pontos ENU na imagem com uma pose ou com um lote de F poses, de uma vez.
+
+    :param R: Rotacao mundo -> camera (3,3) ou (F,3,3)
+    :param t: Translacao (3,), (3,1) ou (F,3)
+    :param points: Pontos ENU (M,3)
+    :param width: Largura da imagem; se None, o teste de visibilidade so considera a profundidade
+    :return: (pixels (...,M,2), depths (...,M), visible (...,M)), com ... = () para uma pose ou (F,) para o lote.
+             visible indica ponto a frente de near e dentro da imagem
+    """
+    R = np.asarray(R, dtype=np.float64)
+    t = np.asarray(t, dtype=np.float64).reshape(R.shape[:-2] + (1, 3))
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+    points_camera = np.einsum('...ij,mj->...mi', R, points) + t
+    depths = points_camera[..., 2]
+    homogeneous = points_camera @ np.asarray(K).T
+    with np.errstate(divide='ignore', invalid='ignore'):
+        pixels = homogeneous[..., :2] / homogeneous[..., 2:]
+    visible = depths > near
+    if width is not None:
+        visible &= (pixels[..., 0] >= 0) & (pixels[..., 0] < width) & (pixels[..., 1] >= 0) & (pixels[..., 1] < height)
+    return pixels, depths, visible
+
+def project_points(K, R, t, points):
+    """ Projeta pontos ENU (M,3) na imagem com a pose (R, t); retorna pixels (M,2). """
+    return project(K, R, t, points)[0]
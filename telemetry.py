@@ -0,0 +1,94 @@
+import hashlib
+import os
+import re
+import numpy as np
+
+# Versao do formato do cache; incrementar ao mudar as colunas
+SRT_CACHE_VERSION = 1
+
+SRT_COLUMNS = ('frame_index', 'time', 'diff_time_ms', 'latitude', 'longitude', 'rel_alt', 'abs_alt',
+               'gb_yaw', 'gb_pitch', 'gb_roll', 'focal_len')
+
+time_regex = re.compile(r'(\d+):(\d+):(\d+),(\d+)\s*-->')
+difftime_regex = re.compile(r'DiffTime: (\d+)ms')
+data_regex = re.compile(r'(\w+): ([-+]?[\d.]+)')
+
+def file_sha1(file_path):
+    sha1 = hashlib.sha1()
+    with open(file_path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1 << 20), b''):
+            sha1.update(chunk)
+    return sha1.hexdigest()
+
+def parse_srt_stream(file_path):
+    """
+    Le o .SRT do DJI linha a linha, sem carregar o arquivo inteiro.
+
+    :return: Dicionario coluna -> array NumPy, uma linha por frame na ordem do arquivo
+    """
+    columns = {name: [] for name in SRT_COLUMNS}
+    block = []
+
+    def flush(block):
+        # Blocos: indice, intervalo de tempo, FrameCnt/DiffTime, data e hora, dados entre colchetes
+        if len(block) < 5:
+            return
+        h, m, sec, ms = time_regex.search(block[1]).groups()
+        data = dict(data_regex.findall(block[4]))
+        columns['frame_index'].append(int(block[0]))
+        columns['time'].append(int(h) * 3600 + int(m) * 60 + int(sec) + int(ms) / 1000)
+        columns['diff_time_ms'].append(int(difftime_regex.search(block[2]).group(1)))
+        for name in SRT_COLUMNS[3:]:
+            columns[name].append(float(data.get(name, 'nan')))
+
+    with open(file_path, 'r', encoding='utf-8') as file:
+        for line in file:
+            line = line.strip()
+            if line:
+                block.append(line)
+            else:
+                flush(block)
+                block = []
+        flush(block)
+
+    frame_data = {name: np.array(values, dtype=np.float64) for name, values in columns.items()}
+    frame_data['frame_index'] = frame_data['frame_index'].astype(np.int64)
+    frame_data['diff_time_ms'] = frame_data['diff_time_ms'].astype(np.int64)
+    return frame_data
+
+def parse_srt(file_path, cache=True):
+    """
+    Telemetria do .SRT em colunas, usando um cache binario (.npz) ao lado do arquivo.
+
+    O cache vale enquanto mtime e tamanho do .SRT nao mudarem; se mudarem, o hash do
+    conteudo decide se ele ainda pode ser usado, e o cache e regravado com o novo mtime e tamanho.
+    """
+    stat = os.stat(file_path)
+    cache_path = file_path + ".npz"
+    frame_data = None
+    sha1 = None
+
+    if cache and os.path.exists(cache_path):
+        try:
+            with np.load(cache_path) as cached:
+                if int(cached['version']) == SRT_CACHE_VERSION:
+                    if int(cached['mtime_ns']) == stat.st_mtime_ns and int(cached['size']) == stat.st_size:
+                        return {name: cached[name] for name in SRT_COLUMNS}
+                    sha1 = file_sha1(file_path)
+                    if str(cached['sha1']) == sha1:
+                        frame_data = {name: cached[name] for name in SRT_COLUMNS}
+        except (OSError, KeyError, ValueError) as e:
+            print(f"Cache do SRT invalido ({e}), relendo {file_path}")
+
+    if frame_data is None:
+        frame_data = parse_srt_stream(file_path)
+
+    if cache:
+        try:
+            with open(cache_path, 'wb') as cache_file:
+                np.savez(cache_file, version=SRT_CACHE_VERSION, mtime_ns=stat.st_mtime_ns, size=stat.st_size,
+                         sha1=sha1 or file_sha1(file_path), **frame_data)
+        except OSError as e:
+            print(f"Nao foi possivel gravar o cache do SRT: {e}")
+
+    return frame_data
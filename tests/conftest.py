@@ -0,0 +1,18 @@
+import os
+import sys
+import pytest
+
+# Os modulos ficam na raiz do repositorio
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from camera import load_camera
+
+@pytest.fixture
+def data_dir():
+    """ Dados do voo de exemplo (QuintaBoaVista). """
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), "QuintaBoaVista")
+
+@pytest.fixture
+def K(data_dir):
+    """ Matriz de intrinsecos da camera do voo de exemplo. """
+    return load_camera(os.path.join(data_dir, "K-mavic-HD.json"))[0]
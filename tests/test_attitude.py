@@ -0,0 +1,21 @@
+import numpy as np
+from attitude import ransac_rotation
+from pose import yaw_pitch_roll_to_rotation_matrix
+
+def test_ransac_rotation_rejects_outlier_roi():
+    rng = np.random.default_rng(0)
+    R_true = yaw_pitch_roll_to_rotation_matrix(30.0, -60.0, 5.0)
+    a = rng.normal(size=(2, 5, 3))
+    a /= np.linalg.norm(a, axis=-1, keepdims=True)
+    b = a @ R_true.T
+    # ROI 2 do primeiro frame rastreado no lugar errado
+    outlier = np.array([b[0, 2, 1], -b[0, 2, 0], b[0, 2, 2]])
+    b[0, 2] = outlier / np.linalg.norm(outlier)
+    valid = np.ones((2, 5), dtype=bool)
+    valid[1, 4] = False
+
+    R, inliers = ransac_rotation(a, b, valid)
+
+    assert np.allclose(R, R_true, atol=1e-9)
+    assert list(inliers[0]) == [True, True, False, True, True]
+    assert list(inliers[1]) == [True, True, True, True, False]
@@ -0,0 +1,20 @@
+import cv2
+import numpy as np
+from camera import Undistorter
+
+WIDTH, HEIGHT = 1920, 1080
+K = np.array([[1400.0, 0.0, 965.0], [0.0, 1400.0, 530.0], [0.0, 0.0, 1.0]])
+DIST = np.array([-0.12, 0.05, 0.0008, -0.0005, -0.01])
+
+def test_undistorted_points_redistort_to_the_original_pixels():
+    rng = np.random.default_rng(0)
+    pixels = rng.uniform(0, [WIDTH, HEIGHT], (500, 2))
+    undistorter = Undistorter(K, DIST)
+
+    undistorted = undistorter.points(pixels)
+    # Pixel sem distorcao -> raio normalizado -> projecao com a distorcao da lente
+    rays = np.hstack((undistorted, np.ones((len(undistorted), 1)))) @ np.linalg.inv(K).T
+    redistorted, _ = cv2.projectPoints(rays, np.zeros(3), np.zeros(3), K, DIST)
+
+    assert np.abs(redistorted.reshape(-1, 2) - pixels).max() < 1e-3
+    assert undistorter.points(np.zeros((0, 2))).shape == (0, 2)
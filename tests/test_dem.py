@@ -0,0 +1,78 @@
+import os
+import numpy as np
+import pytest
+import rasterio
+from affine import Affine
+import dem
+
+def write_tif(path, elevation, transform):
+    with rasterio.open(path, 'w', driver='GTiff', height=elevation.shape[0], width=elevation.shape[1], count=1,
+                       dtype=elevation.dtype, transform=transform) as dataset:
+        dataset.write(elevation, 1)
+
+def test_tiled_dem_reuses_tile_max_cache(tmp_path, monkeypatch):
+    rng = np.random.default_rng(0)
+    elevation = rng.uniform(0, 100, (37, 50)).astype(np.float32)
+    tif_path = str(tmp_path / "dem.tif")
+    write_tif(tif_path, elevation, Affine(1.0, 0, 0, 0, -1.0, 37.0))
+
+    first = dem.TiledDEM(tif_path, tile_size=8)
+    first.close()
+    assert os.path.exists(tif_path + ".tiles8.npz")
+
+    # Com o cache valido a abertura nao le nenhum bloco
+    def no_read(self, tile_row, tile_col):
+        raise AssertionError("bloco lido na abertura")
+    with monkeypatch.context() as patch:
+        patch.setattr(dem.TiledDEM, "_read_tile", no_read)
+        second = dem.TiledDEM(tif_path, tile_size=8)
+    assert np.array_equal(second.heights, first.heights)
+    assert np.array_equal(second[np.array([36]), np.array([49])], elevation[[36], [49]])
+    second.close()
+
+    # Arquivo alterado: o cache e refeito
+    elevation[0, 0] = 500
+    write_tif(tif_path, elevation, Affine(1.0, 0, 0, 0, -1.0, 37.0))
+    os.utime(tif_path, ns=(0, 0))
+    third = dem.TiledDEM(tif_path, tile_size=8)
+    assert third.heights.max() == pytest.approx(500)
+    third.close()
+
+def march(elevation, transform, origin, down, step, max_s):
+    """ Referencia: primeira amostra do raio (a cada step) abaixo do DEM; None se sair do raster antes. """
+    s = np.arange(0, max_s, step)
+    points = origin + s[:, None] * down
+    alt, inside = dem.get_DEM_alt_batch(elevation, transform, points[:, 0], points[:, 1])
+    hit = np.flatnonzero(~inside | (points[:, 2] <= alt))
+    if len(hit) == 0 or not inside[hit[0]]:
+        return None
+    return s[hit[0]]
+
+def test_pyramid_intersect_matches_ray_march():
+    rng = np.random.default_rng(1)
+    elevation = rng.uniform(0, 20, (48, 64))
+    transform = Affine(1.0, 0, 1000.0, 0, -1.0, 2048.0)
+    pyramid = dem.DEMPyramid(elevation, transform)
+
+    n = 100
+    origins = np.column_stack((rng.uniform(1000, 1064, n), rng.uniform(2000, 2048, n), np.full(n, 40.0)))
+    azimuth = rng.uniform(0, 2 * np.pi, n)
+    elevation_angle = np.radians(rng.uniform(20, 90, n))
+    # Direcoes apontando para cima, como em Geolocator
+    directions = np.column_stack((np.cos(elevation_angle) * np.cos(azimuth), np.cos(elevation_angle) * np.sin(azimuth),
+                                  np.sin(elevation_angle)))
+
+    points, status = pyramid.intersect(origins, directions)
+
+    step = 0.002
+    for i in range(n):
+        expected = march(elevation, transform, origins[i], -directions[i], step, 40.0 / directions[i, 2] + step)
+        if expected is None:
+            assert status[i] == dem.DEM_OUTSIDE
+            assert np.isnan(points[i]).all()
+        else:
+            assert status[i] == dem.DEM_HIT
+            s = np.linalg.norm(points[i] - origins[i])
+            assert expected - step - 1e-9 <= s <= expected + 1e-9
+    assert (status == dem.DEM_HIT).sum() > n // 2
+    assert (status == dem.DEM_OUTSIDE).any()
@@ -0,0 +1,96 @@
+import sqlite3
+import threading
+import time
+from http.server import ThreadingHTTPServer
+import numpy as np
+import pytest
+from detection import DetectionCache, CachedDetector, DetectionPipeline, HTTPDetector
+from detection_stub_server import StubHandler
+
+class CountingDetector:
+    model_id = "test:1"
+
+    def __init__(self):
+        self.calls = 0
+
+    def detect(self, image, frame_index=None):
+        self.calls += 1
+        return [{'x': 10.0, 'y': 20.0, 'width': 4.0, 'height': 6.0, 'confidence': 0.9, 'class_id': 0, 'class': '0'}]
+
+def last_used(db_path):
+    connection = sqlite3.connect(db_path)
+    try:
+        return connection.execute("SELECT last_used FROM detections").fetchone()[0]
+    finally:
+        connection.close()
+
+def test_cache_hit_last_used_persisted_on_close(tmp_path):
+    db_path = str(tmp_path / "detections.sqlite")
+    image = np.zeros((32, 32, 3), dtype=np.uint8)
+    backend = CountingDetector()
+
+    detector = CachedDetector(backend, DetectionCache(db_path), "video")
+    first = detector.detect(image, 0)
+    detector.close()
+    stored = last_used(db_path)
+
+    # Segunda execucao: acerto no cache, com o ultimo uso gravado ao fechar o pipeline
+    pipeline = DetectionPipeline(CachedDetector(backend, DetectionCache(db_path), "video"))
+    assert pipeline.submit(0, image)
+    pipeline.close()
+
+    assert backend.calls == 1
+    assert pipeline.results() == [(0, first)]
+    assert last_used(db_path) > stored
+
+def test_http_pipeline_with_stub_server():
+    pytest.importorskip("inference_sdk")
+
+    class SlowLargeFrames(StubHandler):
+        # Frames maiores demoram mais: os resultados chegam fora da ordem de envio
+        def do_POST(self):
+            self.delay = 0.5 if int(self.headers.get('Content-Length', 0)) > 20000 else 0.0
+            super().do_POST()
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), SlowLargeFrames)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        detector = HTTPDetector(f"http://127.0.0.1:{server.server_port}", "stub", "car-models-rr7w5/1", scale=2)
+        pipeline = DetectionPipeline(detector, max_in_flight=2)
+        rng = np.random.default_rng(0)
+        frames = {0: rng.integers(0, 256, (720, 1280, 3), dtype=np.uint8), 1: np.zeros((120, 160, 3), dtype=np.uint8),
+                  2: np.zeros((240, 320, 3), dtype=np.uint8)}
+
+        assert pipeline.submit(0, frames[0])
+        assert pipeline.submit(1, frames[1])
+        # Janela cheia: o frame seguinte nao e enviado
+        assert not pipeline.submit(2, frames[2])
+        assert len(pipeline) == 2
+
+        def wait_results(results, count):
+            deadline = time.time() + 10
+            while len(results) < count and time.time() < deadline:
+                results.extend(pipeline.results())
+                time.sleep(0.01)
+
+        results = []
+        wait_results(results, 2)
+        assert [frame_index for frame_index, _ in results] == [1, 0]
+        assert len(pipeline) == 0
+        assert pipeline.submit(2, frames[2])
+        wait_results(results, 3)
+        pipeline.close()
+
+        for frame_index, predictions in results:
+            height, width = frames[frame_index].shape[:2]
+            assert len(predictions) == 1
+            assert predictions[0]['class_id'] == 0
+            # O stub responde no centro da imagem reduzida; o detector leva de volta a escala original
+            assert predictions[0]['x'] == pytest.approx(width / 2)
+            assert predictions[0]['y'] == pytest.approx(height / 2)
+            assert predictions[0]['width'] == pytest.approx(width / 10)
+        assert sorted(frame_index for frame_index, _ in results) == [0, 1, 2]
+    finally:
+        server.shutdown()
+        server.server_close()
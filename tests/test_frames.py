@@ -0,0 +1,47 @@
+import cv2
+import numpy as np
+import pytest
+from frames import FrameStore
+
+WIDTH, HEIGHT, COUNT = 160, 120, 40
+
+def frame_value(index):
+    return 20 + index * 5
+
+def write_video(path):
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'MJPG'), 30, (WIDTH, HEIGHT))
+    if not writer.isOpened():
+        pytest.skip("codec MJPG indisponivel")
+    for index in range(COUNT):
+        writer.write(np.full((HEIGHT, WIDTH, 3), frame_value(index), dtype=np.uint8))
+    writer.release()
+
+def assert_frame(image, index):
+    assert image.shape == (HEIGHT, WIDTH, 3)
+    assert abs(image.mean() - frame_value(index)) < 2
+
+def test_frame_store_sequential_seek_and_budget(tmp_path):
+    path = str(tmp_path / "frames.avi")
+    write_video(path)
+    # 1 MB: cabem so alguns frames no cache e na fila
+    store = FrameStore(cv2.VideoCapture(path), cache_mb=1, prefetch=4)
+    try:
+        for index in range(COUNT):
+            assert_frame(store.get(index), index)
+            assert store.frames_bytes + store.ahead_bytes <= store.cache_bytes
+        assert len(store.frames) < COUNT
+
+        # Voltar alguns frames: ainda no cache, sem decodificar de novo
+        cached = store.frames[COUNT - 3]
+        assert store.get(COUNT - 3) is cached
+        # Frame ja descartado: decodificado de novo pela thread
+        assert 0 not in store.frames
+        assert_frame(store.get(0), 0)
+        assert store.frames_bytes + store.ahead_bytes <= store.cache_bytes
+
+        assert store.read_next() == (False, None)
+        with pytest.raises(IndexError):
+            store.get(COUNT)
+    finally:
+        store.close()
+    assert not store.thread.is_alive()
@@ -0,0 +1,87 @@
+import numpy as np
+import utm
+from affine import Affine
+import dem
+from geolocate import Geolocator, GroundMap
+from pose import lat0, lon0, h0
+
+WIDTH, HEIGHT = 1920, 1080
+
+# Camera olhando para baixo: x da imagem = leste, y da imagem = sul
+R_NADIR = np.array([[1.0, 0.0, 0.0], [0.0, -1.0, 0.0], [0.0, 0.0, -1.0]])
+
+def step_geolocator(K, step_east, step_height=10.0, resolution=0.1, size=2000):
+    """ DEM plano na altitude h0 com um degrau de step_height para leste de step_east (ENU), alinhado as colunas. """
+    east0, north0 = utm.from_latlon(lat0, lon0)[:2]
+    transform = Affine(resolution, 0, east0 - size * resolution / 2, 0, -resolution, north0 + size * resolution / 2)
+    elevation = np.full((size, size), h0)
+    columns_east = transform.c + (np.arange(size) + 0.5) * resolution - east0
+    elevation[:, columns_east >= step_east] += step_height
+    return Geolocator(K, lat0, lon0, h0, dem_pyramid=dem.DEMPyramid(elevation, transform))
+
+def test_ground_map_step_parallel_to_grid_edge(K):
+    step = 16
+    altitude = 60.0
+    # Parte alta sob o drone: a borda do degrau oculta o solo mais baixo e aparece na imagem como uma
+    # descontinuidade no meio de uma coluna de celulas; os cantos dos dois lados continuam quase coplanares
+    step_east = (8 * step + step / 2 - K[0, 2]) * altitude / K[0, 0]
+    geolocator = step_geolocator(K, step_east, step_height=5.0)
+    ground_map = GroundMap(geolocator, WIDTH, HEIGHT, step=step)
+    t_drone = np.array([0.0, 0.0, altitude])
+    h_abs = h0 + altitude
+
+    rng = np.random.default_rng(0)
+    pixels = rng.uniform(0, [WIDTH, HEIGHT], (20000, 2))
+    pixels[:5000, 0] = rng.uniform(7 * step, 10 * step, 5000)
+    exact = geolocator.locate(pixels, R_NADIR, t_drone, h_abs)
+    interpolated = ground_map.locate(pixels, R_NADIR, t_drone, h_abs)
+
+    assert not np.isnan(exact).any()
+    assert np.abs(interpolated - exact).max() <= ground_map.max_deviation
+    # As celulas cortadas pelo degrau usam o calculo exato
+    assert not ground_map.reliable.all()
+
+def test_ground_map_builds_grid_only_with_pixels(K):
+    ground_map = GroundMap(step_geolocator(K, 1000.0), WIDTH, HEIGHT)
+    t_drone = np.array([0.0, 0.0, 60.0])
+
+    assert ground_map.locate(np.zeros((0, 2)), R_NADIR, t_drone, h0 + 60.0).shape == (0, 3)
+    assert ground_map.grid is None
+    pixels = np.random.default_rng(0).uniform(0, [WIDTH, HEIGHT], (len(ground_map.sample_pixels) // 10, 2))
+    ground_map.locate(pixels, R_NADIR, t_drone, h0 + 60.0)
+    assert ground_map.grid is not None
+
+def test_ground_map_sparse_query_with_new_pose_is_exact(K, monkeypatch):
+    geolocator = step_geolocator(K, 1000.0)
+    ground_map = GroundMap(geolocator, WIDTH, HEIGHT)
+    ground_map.update(R_NADIR, np.array([0.0, 0.0, 60.0]), h0 + 60.0)
+    grid = ground_map.grid
+
+    def no_update(R, t_drone, h_abs):
+        raise AssertionError("grade montada para uma consulta esparsa")
+    monkeypatch.setattr(ground_map, "update", no_update)
+    pixels = np.array([[100.0, 200.0], [960.0, 540.0], [1500.0, 900.0]])
+    t_drone = np.array([5.0, -3.0, 70.0])
+    points = ground_map.locate(pixels, R_NADIR, t_drone, h0 + 70.0)
+
+    assert np.array_equal(points, geolocator.locate(pixels, R_NADIR, t_drone, h0 + 70.0))
+    assert ground_map.grid is grid
+
+def test_locate_reports_rays_that_miss_the_dem(K):
+    # DEM de 200 m: de 300 m de altura os cantos da imagem ficam fora dele
+    geolocator = step_geolocator(K, 1000.0)
+    pixels = np.array([[K[0, 2], K[1, 2]], [0.0, 0.0], [WIDTH, HEIGHT]])
+
+    points, status = geolocator.locate_with_status(pixels, R_NADIR, np.array([0.0, 0.0, 300.0]), h0 + 300.0)
+
+    assert list(status) == [dem.DEM_HIT, dem.DEM_OUTSIDE, dem.DEM_OUTSIDE]
+    assert np.allclose(points[0], [0.0, 0.0, 0.0], atol=0.1)
+    assert np.isnan(points[1:]).all()
+    assert np.array_equal(geolocator.locate(pixels, R_NADIR, np.array([0.0, 0.0, 300.0]), h0 + 300.0), points, equal_nan=True)
+
+def test_locate_flat_terrain_status(K):
+    geolocator = Geolocator(K, lat0, lon0, h0)
+    points, status = geolocator.locate_with_status([[960.0, 540.0]], R_NADIR, np.array([0.0, 0.0, 50.0]), h0 + 50.0)
+
+    assert list(status) == [dem.DEM_HIT]
+    assert points[0, 2] == 0
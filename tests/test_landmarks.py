@@ -0,0 +1,24 @@
+import numpy as np
+from landmarks import LandmarkRegistry
+from pose import project, yaw_pitch_roll_to_rotation_matrix, droneToMundoR, cameraToDroneR
+
+WIDTH, HEIGHT = 1920, 1080
+
+def test_visible_matches_brute_force_projection(K):
+    rng = np.random.default_rng(0)
+    points = np.column_stack((rng.uniform(-400, 400, (5000, 2)), rng.uniform(0, 30, 5000)))
+    registry = LandmarkRegistry([str(i) for i in range(len(points))], points, cell_size=25.0)
+
+    for yaw, pitch, roll in [(0, -90, 0), (45, -30, 0), (200, -60, 10), (310, -10, -5)]:
+        # Camera mundo -> camera como no PoseTable
+        R_drone = yaw_pitch_roll_to_rotation_matrix(yaw, pitch, roll)
+        R = (droneToMundoR @ R_drone @ cameraToDroneR).T
+        center = np.array([rng.uniform(-100, 100), rng.uniform(-100, 100), 80.0])
+        t = -R @ center
+
+        indexes, pixels = registry.visible(K, R, t, WIDTH, HEIGHT)
+        assert len(indexes) > 0
+        _, _, visible = project(K, R, t, points, WIDTH, HEIGHT)
+
+        assert sorted(registry.names[i] for i in indexes) == sorted(str(i) for i in np.flatnonzero(visible))
+        assert np.allclose(pixels, project(K, R, t, registry.points[indexes])[0])
@@ -0,0 +1,54 @@
+import json
+import os
+import cv2
+import numpy as np
+import pytest
+import utm
+from affine import Affine
+import dem
+from geolocate import Geolocator
+from locate_batch import geolocate_observations, load_frame_size
+from pose import PoseTable, lat0, lon0, h0
+from telemetry import parse_srt
+
+@pytest.fixture
+def flight(data_dir, K):
+    frame_info = parse_srt(os.path.join(data_dir, "DJI_20241209160542_0002_S.SRT"), cache=False)
+    return Geolocator(K, lat0, lon0, h0), frame_info, PoseTable(frame_info, lat0, lon0, h0)
+
+def test_frames_outside_telemetry_are_skipped(flight, capsys):
+    geolocator, frame_info, poses = flight
+    observations = [(1, (960, 540)), (len(poses), (960, 540)), (-1, (960, 540)), (len(poses) - 1, (960, 540))]
+
+    lines = geolocate_observations(geolocator, frame_info, poses, observations, np.full(3, np.nan))
+
+    assert [int(line.split(';')[0]) for line in lines] == [1, len(poses) - 1]
+    errors = capsys.readouterr().err
+    assert f"Frame {len(poses)} " in errors
+    assert "Frame -1 " in errors
+
+def test_frame_size_from_video_or_camera_file(data_dir, tmp_path):
+    camera_path = str(tmp_path / "camera.json")
+    with open(camera_path, "w") as json_file:
+        json.dump({"K": [[1000, 0, 700], [0, 1000, 400], [0, 0, 1]], "width": 1280, "height": 720}, json_file)
+    assert load_frame_size({"K_path": camera_path}) == (1280, 720)
+    assert load_frame_size({"K_path": os.path.join(data_dir, "K-mavic-HD.json")}) == (1920, 1080)
+
+    video_path = str(tmp_path / "video.avi")
+    writer = cv2.VideoWriter(video_path, cv2.VideoWriter_fourcc(*'MJPG'), 30, (320, 240))
+    writer.write(np.zeros((240, 320, 3), dtype=np.uint8))
+    writer.release()
+    assert load_frame_size({"K_path": camera_path, "video_path": video_path}) == (320, 240)
+
+def test_prefetch_covers_the_frame_size(flight, K, monkeypatch):
+    _, frame_info, poses = flight
+    # DEM plano na altitude da origem, so para ativar o carregamento antecipado
+    east0, north0 = utm.from_latlon(lat0, lon0)[:2]
+    dem_pyramid = dem.DEMPyramid(np.full((100, 100), h0), Affine(10.0, 0, east0 - 500, 0, -10.0, north0 + 500))
+    geolocator = Geolocator(K, lat0, lon0, h0, dem_pyramid=dem_pyramid)
+    sizes = []
+    monkeypatch.setattr(geolocator, "prefetch", lambda R, t_drone, h_abs, h_rel, width, height: sizes.append((width, height)))
+
+    geolocate_observations(geolocator, frame_info, poses, [(1, (960, 540)), (2, (10, 10))], np.full(3, np.nan), frame_size=(1280, 720))
+
+    assert sizes == [(1280, 720), (1280, 720)]
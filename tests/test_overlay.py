@@ -0,0 +1,63 @@
+import numpy as np
+from overlay import marker_boxes, merge_boxes, composite_overlay, OverlayCompositor
+
+K = np.array([[1000.0, 0.0, 960.0], [0.0, 1000.0, 540.0], [0.0, 0.0, 1.0]])
+WIDTH, HEIGHT = 1920, 1080
+
+def test_marker_boxes_behind_camera():
+    centers = np.array([[0.0, 0.0, 50.0], [0.0, 0.0, -50.0], [0.0, 0.0, 1.0]])
+
+    boxes = marker_boxes(K, centers, 5.0, WIDTH, HEIGHT)
+
+    assert 0 < boxes[0, 0] < boxes[0, 2] < WIDTH
+    # Todo atras da camera: nada a compor
+    assert list(boxes[1]) == [0, 0, 0, 0]
+    # Cruza o plano da camera: imagem toda
+    assert list(boxes[2]) == [0, 0, WIDTH, HEIGHT]
+
+def test_composite_overlapping_boxes_blends_once():
+    rendered = np.zeros((100, 100, 4), dtype=np.uint8)
+    rendered[:, :, :3] = 255
+    rendered[:, :, 3] = 128
+    image = np.zeros((100, 100, 3), dtype=np.uint8)
+    expected = np.zeros_like(image)
+    expected[10:60, 10:60] = (255 * 128 + 127) // 255
+
+    composite_overlay(rendered, image, [(10, 10, 40, 40), (30, 30, 60, 60), (0, 0, 0, 0)])
+
+    # Os retangulos sao unidos no retangulo que contem os dois
+    assert np.array_equal(image, expected)
+
+def reference_blend(rendered, image):
+    alpha = rendered[:, :, 3:4].astype(np.uint16)
+    return ((rendered[:, :, :3] * alpha + image * (255 - alpha) + 127) // 255).astype(np.uint8)
+
+def test_composite_matches_reference_blend():
+    rng = np.random.default_rng(0)
+    rendered = rng.integers(0, 256, (HEIGHT, WIDTH, 4), dtype=np.uint8)
+    image = rng.integers(0, 256, (HEIGHT, WIDTH, 3), dtype=np.uint8)
+    compositor = OverlayCompositor()
+
+    full = compositor.composite(rendered, image.copy(), [(0, 0, WIDTH, HEIGHT)])
+    assert np.array_equal(full, reference_blend(rendered, image))
+
+    # Fora dos marcadores a renderizacao e transparente (limpa com alfa 0)
+    boxes = [(100, 50, 300, 250), (1800, 1000, 1920, 1080), (250, 200, 400, 320), (280, 230, 290, 240)]
+    inside = np.zeros((HEIGHT, WIDTH), dtype=bool)
+    for x0, y0, x1, y1 in boxes:
+        inside[y0:y1, x0:x1] = True
+    rendered[~inside, 3] = 0
+    partial = compositor.composite(rendered, image.copy(), boxes)
+    assert np.array_equal(partial, reference_blend(rendered, image))
+
+def test_merge_boxes_does_not_produce_mostly_empty_union():
+    # Caixas finas cruzadas: a uniao seria quase toda vazia
+    boxes = merge_boxes([(0, 45, 100, 55), (45, 0, 55, 100)])
+
+    coverage = np.zeros((100, 100), dtype=int)
+    for x0, y0, x1, y1 in boxes:
+        coverage[y0:y1, x0:x1] += 1
+    expected = np.zeros((100, 100), dtype=int)
+    expected[45:55, :] = 1
+    expected[:, 45:55] = 1
+    assert np.array_equal(coverage, expected)
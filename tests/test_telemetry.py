@@ -0,0 +1,30 @@
+import os
+import shutil
+import numpy as np
+from telemetry import parse_srt, parse_srt_stream, SRT_COLUMNS
+
+SRT_PATH = os.path.join(os.path.dirname(__file__), "QuintaBoaVista", "DJI_20241209160542_0002_S.SRT")
+
+def assert_same_columns(frame_data, expected):
+    assert set(frame_data) == set(SRT_COLUMNS)
+    for name in SRT_COLUMNS:
+        assert np.array_equal(frame_data[name], expected[name]), name
+
+def test_npz_cache_matches_parse_and_follows_file_changes(tmp_path):
+    srt_path = str(tmp_path / "flight.SRT")
+    shutil.copyfile(SRT_PATH, srt_path)
+    fresh = parse_srt_stream(srt_path)
+
+    assert_same_columns(parse_srt(srt_path), fresh)
+    assert os.path.exists(srt_path + ".npz")
+    assert_same_columns(parse_srt(srt_path), fresh)
+
+    # Arquivo alterado: o cache e refeito com o novo conteudo
+    with open(srt_path, 'r', encoding='utf-8') as file:
+        blocks = file.read().split('\n\n')
+    with open(srt_path, 'w', encoding='utf-8') as file:
+        file.write('\n\n'.join(blocks[:10]) + '\n')
+    changed = parse_srt_stream(srt_path)
+    assert len(changed['frame_index']) < len(fresh['frame_index'])
+    assert_same_columns(parse_srt(srt_path), changed)
+    assert_same_columns(parse_srt(srt_path), changed)
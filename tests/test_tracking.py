@@ -0,0 +1,32 @@
+import cv2
+import numpy as np
+import pytest
+from tracking import HomographyTracker
+from pose import yaw_pitch_roll_to_rotation_matrix
+
+WIDTH, HEIGHT = 640, 480
+K = np.array([[500.0, 0.0, 320.0], [0.0, 500.0, 240.0], [0.0, 0.0, 1.0]])
+
+def textured_image():
+    rng = np.random.default_rng(0)
+    image = np.zeros((HEIGHT, WIDTH), dtype=np.uint8)
+    for _ in range(400):
+        center = tuple(int(c) for c in rng.integers(0, [WIDTH, HEIGHT]))
+        cv2.circle(image, center, int(rng.integers(3, 12)), int(rng.integers(60, 255)), -1)
+    return cv2.GaussianBlur(image, (5, 5), 1.0)
+
+@pytest.mark.parametrize("image_scale", [1, 0.5])
+def test_homography_tracker_recovers_pure_rotation(image_scale):
+    R_key = yaw_pitch_roll_to_rotation_matrix(30.0, -60.0, 0.0)
+    t_drone = np.array([0.0, 0.0, 100.0])
+    # Rotacao pura da camera entre os frames: x' ~ K Q K^-1 x
+    Q = cv2.Rodrigues(np.radians([0.5, -0.8, 1.0]))[0]
+    image = textured_image()
+    warped = cv2.warpPerspective(image, K @ Q @ np.linalg.inv(K), (WIDTH, HEIGHT))
+
+    tracker = HomographyTracker(K, image_scale=image_scale)
+    assert tracker.update(0, image, R_key, t_drone, 100.0) is R_key
+    R_alt = tracker.update(1, warped, R_key, t_drone, 100.0)
+
+    angle = np.degrees(np.arccos(np.clip((np.trace(R_alt @ (Q @ R_key).T) - 1) / 2, -1.0, 1.0)))
+    assert angle < 0.05
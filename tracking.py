@@ -0,0 +1,369 @@
+import cv2
+import threading
+from collections import OrderedDict
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from pose import project
+
+class CPUTemplateMatcher:
+    """ Busca no frame inteiro na CPU (cv2.matchTemplate libera o GIL, entao pode rodar em varias threads). """
+    def prepare(self, image_gray):
+        self.image_gray = image_gray
+
+    def match(self, index, template_gray):
+        return cv2.matchTemplate(self.image_gray, template_gray, cv2.TM_CCOEFF_NORMED)
+
+class CudaTemplateMatcher:
+    """
+    Busca no frame inteiro na GPU: o frame e enviado uma unica vez por prepare() e cada
+    template fica na GPU com seu proprio matcher e stream, para rodar em paralelo.
+    """
+    def __init__(self):
+        self.gsrc = cv2.cuda.GpuMat()
+        self.per_template = {}
+
+    def prepare(self, image_gray):
+        self.gsrc.upload(image_gray)
+
+    def match(self, index, template_gray):
+        if index not in self.per_template:
+            stream = cv2.cuda.Stream()
+            gtemplate = cv2.cuda.GpuMat()
+            gtemplate.upload(template_gray, stream)
+            matcher = cv2.cuda.createTemplateMatching(cv2.CV_8UC1, cv2.TM_CCOEFF_NORMED)
+            self.per_template[index] = (stream, gtemplate, matcher)
+        stream, gtemplate, matcher = self.per_template[index]
+        gresult = matcher.match(self.gsrc, gtemplate, stream=stream)
+        result = gresult.download(stream)
+        stream.waitForCompletion()
+        return result
+
+class ROITracker:
+    """
+    Rastreamento dos templates de ROI entre frames, todos os ROIs em paralelo em um pool de threads.
+
+    Cada ROI e procurado primeiro em uma janela em torno da posicao prevista (ultima posicao,
+    corrigida pela mudanca de pose quando a posicao ENU do ROI e conhecida), comecando em um
+    nivel reduzido da piramide da imagem e refinando na resolucao original. A busca no frame
+    inteiro (matcher) so e usada sem posicao anterior ou quando a similaridade fica abaixo
+    de minimum_confidence.
+    """
+    def __init__(self, minimum_confidence, search_radius=64, levels=2, min_template_size=8, matcher=None, workers=None):
+        self.minimum_confidence = minimum_confidence
+        self.search_radius = search_radius
+        self.levels = levels
+        self.min_template_size = min_template_size
+        self.matcher = matcher if matcher is not None else CPUTemplateMatcher()
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.prepare_lock = threading.Lock()
+        self.prepared = False
+        self.templates = []
+        self.template_pyramids = []
+        self.roi_enus = []
+        self.last_centers = []
+        self.last_projections = []
+
+    def __len__(self):
+        return len(self.templates)
+
+    def add(self, template_gray, roi_enu=None):
+        pyramid = [template_gray]
+        while len(pyramid) <= self.levels and min(pyramid[-1].shape) // 2 >= self.min_template_size:
+            pyramid.append(cv2.pyrDown(pyramid[-1]))
+        self.templates.append(template_gray)
+        self.template_pyramids.append(pyramid)
+        self.roi_enus.append(None if roi_enu is None else np.asarray(roi_enu, dtype=np.float64).reshape(3))
+        self.last_centers.append(None)
+        self.last_projections.append(None)
+
+    def _predict(self, i, projections):
+        if self.last_centers[i] is None:
+            return None
+        if projections is None or projections[i] is None or self.last_projections[i] is None:
+            return self.last_centers[i]
+        return self.last_centers[i] + (projections[i] - self.last_projections[i])
+
+    def _search(self, image_pyramid, i, center):
+        template = self.templates[i]
+        h, w = template.shape
+        H, W = image_pyramid[0].shape
+        r = self.search_radius
+        x0 = int(max(0, center[0] - w / 2 - r))
+        y0 = int(max(0, center[1] - h / 2 - r))
+        x1 = int(min(W, center[0] + w / 2 + r))
+        y1 = int(min(H, center[1] + h / 2 + r))
+        if x1 - x0 < w or y1 - y0 < h:
+            return None, -1.0
+
+        # Busca grosseira no nivel mais reduzido disponivel para este template
+        level = len(self.template_pyramids[i]) - 1
+        scale = 2 ** level
+        if level > 0:
+            window = image_pyramid[level][y0 // scale:-(-y1 // scale), x0 // scale:-(-x1 // scale)]
+            template_level = self.template_pyramids[i][level]
+            if window.shape[0] >= template_level.shape[0] and window.shape[1] >= template_level.shape[1]:
+                result = cv2.matchTemplate(window, template_level, cv2.TM_CCOEFF_NORMED)
+                _, _, _, loc = cv2.minMaxLoc(result)
+                x = (x0 // scale + loc[0]) * scale
+                y = (y0 // scale + loc[1]) * scale
+                # Refinar em uma janela pequena na resolucao original
+                x0 = max(0, x - scale - 1)
+                y0 = max(0, y - scale - 1)
+                x1 = min(W, x + w + scale + 1)
+                y1 = min(H, y + h + scale + 1)
+
+        result = cv2.matchTemplate(image_pyramid[0][y0:y1, x0:x1], template, cv2.TM_CCOEFF_NORMED)
+        _, max_val, _, loc = cv2.minMaxLoc(result)
+        return (x0 + loc[0], y0 + loc[1]), max_val
+
+    def track(self, image_gray, project=None):
+        """
+        :param project: Funcao que leva pontos ENU (M,3) a pixels (M,2) na pose do frame atual
+        :return: (centers (N,2), scores (N,)) - centro e similaridade de cada ROI
+        """
+        n = len(self.templates)
+        centers = np.zeros((n, 2))
+        scores = np.full(n, -1.0)
+        if n == 0:
+            return centers, scores
+
+        projections = None
+        known = [i for i in range(n) if self.roi_enus[i] is not None]
+        if project is not None and known:
+            projected = project(np.array([self.roi_enus[i] for i in known]))
+            projections = [None] * n
+            for k, i in enumerate(known):
+                projections[i] = projected[k]
+
+        image_pyramid = [image_gray]
+        for _ in range(max(len(pyramid) for pyramid in self.template_pyramids) - 1):
+            image_pyramid.append(cv2.pyrDown(image_pyramid[-1]))
+
+        self.prepared = False
+        results = self.executor.map(lambda i: self._track_one(image_pyramid, i, projections), range(n))
+        for i, (center, max_val) in enumerate(results):
+            centers[i] = center
+            scores[i] = max_val
+            self.last_centers[i] = centers[i].copy()
+            self.last_projections[i] = None if projections is None else projections[i]
+        return centers, scores
+
+    def _track_one(self, image_pyramid, i, projections):
+        h, w = self.templates[i].shape
+        predicted = self._predict(i, projections)
+        loc, max_val = (None, -1.0) if predicted is None else self._search(image_pyramid, i, predicted)
+        if max_val < self.minimum_confidence:
+            full_loc, full_val = self._full_search(image_pyramid[0], i)
+            if full_val > max_val:
+                loc, max_val = full_loc, full_val
+        return (loc[0] + w / 2, loc[1] + h / 2), max_val
+
+    def _full_search(self, image_gray, i):
+        # O frame so e preparado (enviado a GPU) uma vez, e somente se algum ROI precisar
+        with self.prepare_lock:
+            if not self.prepared:
+                self.matcher.prepare(image_gray)
+                self.prepared = True
+        result = self.matcher.match(i, self.templates[i])
+        _, max_val, _, max_loc = cv2.minMaxLoc(result)
+        return max_loc, max_val
+
+class DetectionTracker:
+    """
+    Trilhas dos objetos detectados, para rodar o detector a cada interval frames ou quando uma trilha se perde.
+
+    Cada trilha guarda o ponto ENU do objeto no solo (intersecao com o DEM), a velocidade estimada
+    entre deteccoes e o tamanho da caixa em metros. Entre deteccoes a caixa e prevista projetando o
+    ponto com a pose do frame atual e escalando o tamanho pela profundidade.
+    """
+    def __init__(self, interval=5, gate=5.0, max_missed=2, max_age=30, smoothing=0.5):
+        self.interval = interval
+        self.gate = gate
+        self.max_missed = max_missed
+        self.max_age = max_age
+        self.smoothing = smoothing
+        self.tracks = []
+        self.next_id = 0
+        self.last_request = None
+        self.lost = False
+
+    def __len__(self):
+        return len(self.tracks)
+
+    def needs_detection(self, frame_index):
+        if self.last_request is None or self.lost:
+            return True
+        elapsed = frame_index - self.last_request
+        return elapsed < 0 or elapsed >= self.interval
+
+    def requested(self, frame_index):
+        self.last_request = frame_index
+        self.lost = False
+
+    def _points_at(self, frame_index):
+        return np.array([track['point'] + track['velocity'] * (frame_index - track['frame']) for track in self.tracks]).reshape(-1, 3)
+
+    def update(self, frame_index, predictions, points_ENU, R, t):
+        """
+        Associa as deteccoes de um frame (possivelmente antigo) as trilhas, pela distancia no solo.
+
+        :param points_ENU: Ponto no solo de cada predicao (N,3), NaN se nao houver
+        :param R: Pose do frame das deteccoes (R, t)
+        """
+        points_ENU = np.asarray(points_ENU, dtype=np.float64).reshape(-1, 3)
+        valid = [i for i in range(len(predictions)) if not np.isnan(points_ENU[i]).any()]
+        depths = (points_ENU @ np.asarray(R).T + np.asarray(t).reshape(1, 3))[:, 2]
+
+        # Associacao gulosa pela menor distancia horizontal entre a posicao prevista e a detectada
+        predicted = self._points_at(frame_index)
+        pairs = []
+        for track_index in range(len(self.tracks)):
+            for i in valid:
+                distance = np.linalg.norm(predicted[track_index, :2] - points_ENU[i, :2])
+                if distance < self.gate:
+                    pairs.append((distance, track_index, i))
+        matched_tracks, matched_predictions = set(), set()
+        for _, track_index, i in sorted(pairs):
+            if track_index in matched_tracks or i in matched_predictions:
+                continue
+            matched_tracks.add(track_index)
+            matched_predictions.add(i)
+            track = self.tracks[track_index]
+            elapsed = frame_index - track['frame']
+            if elapsed > 0:
+                velocity = (points_ENU[i] - track['point']) / elapsed
+                track['velocity'] = self.smoothing * velocity + (1 - self.smoothing) * track['velocity']
+            track.update(point=points_ENU[i].copy(), frame=frame_index, missed=0, prediction=predictions[i],
+                         size=(predictions[i]['width'] * depths[i], predictions[i]['height'] * depths[i]))
+
+        for track_index, track in enumerate(self.tracks):
+            if track_index not in matched_tracks:
+                track['missed'] += 1
+        self.tracks = [track for track in self.tracks if track['missed'] <= self.max_missed]
+
+        for i in valid:
+            if i not in matched_predictions and depths[i] > 0:
+                self.tracks.append({'id': self.next_id, 'point': points_ENU[i].copy(), 'frame': frame_index,
+                                    'velocity': np.zeros(3), 'missed': 0, 'prediction': predictions[i],
+                                    'size': (predictions[i]['width'] * depths[i], predictions[i]['height'] * depths[i])})
+                self.next_id += 1
+
+    def predict(self, K, R, t, frame_index, width, height):
+        """
+        Caixas das trilhas no frame atual. Trilhas antigas demais ou fora da imagem sao descartadas
+        e pedem uma nova deteccao.
+
+        :return: (predicoes no formato do detector com 'track_id', pontos ENU (M,3))
+        """
+        self.tracks = [track for track in self.tracks if abs(frame_index - track['frame']) <= self.max_age]
+        points = self._points_at(frame_index)
+        pixels, depths, visible = project(K, R, t, points, width, height)
+        if not np.all(visible):
+            self.lost = True
+            self.tracks = [track for track, inside in zip(self.tracks, visible) if inside]
+            pixels, depths, points = pixels[visible], depths[visible], points[visible]
+
+        predictions = []
+        for track, pixel, depth in zip(self.tracks, pixels, depths):
+            prediction = dict(track['prediction'])
+            prediction.update(x=pixel[0], y=pixel[1], width=track['size'][0] / depth, height=track['size'][1] / depth,
+                              track_id=track['id'])
+            predictions.append(prediction)
+        return predictions, points
+
+def nearest_rotation(M):
+    """ Rotacao mais proxima (SVD) de uma matriz 3x3, removendo escala e ruido. """
+    U, _, Vt = np.linalg.svd(M)
+    R = U @ Vt
+    if np.linalg.det(R) < 0:
+        R = U @ np.diag([1, 1, -1]) @ Vt
+    return R
+
+class HomographyTracker:
+    """
+    Refinamento da atitude por homografia entre um frame chave e o frame atual.
+
+    Os pontos sao detectados so nos frames chave (e guardados em um cache limitado, para voltar
+    a um trecho ja visto) e seguidos frame a frame com KLT piramidal. Com o drone praticamente
+    parado em relacao ao frame chave, a homografia e uma rotacao pura: R_alt = (K^-1 H K) R_chave.
+    Um novo frame chave e escolhido quando os frames nao sao consecutivos, quando sobram poucos
+    pontos ou quando o drone se desloca mais que max_translation * h_rel.
+    """
+    def __init__(self, K, max_translation=0.01, max_corners=200, min_points=30, lk_levels=3, image_scale=0.5, cache_size=64):
+        self.K = np.asarray(K, dtype=np.float64)
+        self.K_inv = np.linalg.inv(self.K)
+        self.max_translation = max_translation
+        self.max_corners = max_corners
+        self.min_points = min_points
+        self.window_size = (21, 21)
+        self.lk_levels = lk_levels
+        self.criteria = (cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 30, 0.01)
+        self.image_scale = image_scale
+        self.cache_size = cache_size
+        self.keyframe_points = OrderedDict()
+        self.key_index = None
+        self.last_index = None
+        self.R_alt = None
+
+    def _detect(self, frame_index, image_gray):
+        if frame_index in self.keyframe_points:
+            self.keyframe_points.move_to_end(frame_index)
+            return self.keyframe_points[frame_index]
+        points = cv2.goodFeaturesToTrack(image_gray, self.max_corners, 0.01, 10)
+        points = np.zeros((0, 1, 2), dtype=np.float32) if points is None else points
+        self.keyframe_points[frame_index] = points
+        while len(self.keyframe_points) > self.cache_size:
+            self.keyframe_points.popitem(last=False)
+        return points
+
+    def _reduce(self, image_gray):
+        if self.image_scale == 1:
+            return image_gray
+        return cv2.resize(image_gray, None, fx=self.image_scale, fy=self.image_scale, interpolation=cv2.INTER_AREA)
+
+    def _flow(self, previous, current, points):
+        return cv2.calcOpticalFlowPyrLK(previous, current, points, None, winSize=self.window_size,
+                                        maxLevel=self.lk_levels, criteria=self.criteria)
+
+    def _keyframe(self, frame_index, image_gray, R, t_drone):
+        # Pontos e imagens na resolucao reduzida por image_scale
+        image_gray = self._reduce(image_gray)
+        self.key_index = frame_index
+        self.key_R = R
+        self.key_t = np.asarray(t_drone, dtype=np.float64).reshape(3)
+        self.key_points = self._detect(frame_index, image_gray)
+        self.points = self.key_points.copy()
+        self.previous_gray = image_gray
+        self.last_index = frame_index
+        self.R_alt = R
+        return self.R_alt
+
+    def update(self, frame_index, image_gray, R, t_drone, h_rel):
+        """
+        :param R: Rotacao mundo -> camera da telemetria do frame atual
+        :return: R_alt, a rotacao do frame atual estimada pela homografia
+        """
+        if frame_index == self.last_index:
+            return self.R_alt
+        moved = self.key_index is not None and \
+            np.linalg.norm(np.asarray(t_drone, dtype=np.float64).reshape(3) - self.key_t) >= h_rel * self.max_translation
+        if self.key_index is None or frame_index != self.last_index + 1 or moved or len(self.points) < self.min_points:
+            return self._keyframe(frame_index, image_gray, R, t_drone)
+
+        # KLT do frame anterior para o atual, com verificacao de ida e volta
+        reduced = self._reduce(image_gray)
+        points, status, _ = self._flow(self.previous_gray, reduced, self.points)
+        back, back_status, _ = self._flow(reduced, self.previous_gray, points)
+        good = (status.reshape(-1) == 1) & (back_status.reshape(-1) == 1) & \
+            (np.linalg.norm((back - self.points).reshape(-1, 2), axis=1) < 1.0)
+        self.points, self.key_points = points[good], self.key_points[good]
+        self.previous_gray = reduced
+        self.last_index = frame_index
+        if len(self.points) < self.min_points:
+            return self._keyframe(frame_index, image_gray, R, t_drone)
+
+        H, _ = cv2.findHomography(self.key_points / self.image_scale, self.points / self.image_scale, cv2.RANSAC, 3.0)
+        if H is None:
+            return self._keyframe(frame_index, image_gray, R, t_drone)
+        self.R_alt = nearest_rotation(self.K_inv @ H @ self.K) @ self.key_R
+        return self.R_alt